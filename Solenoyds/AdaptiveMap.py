@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import json
+import numpy as np
+from Solenoyds.Loop import _toCartesian
+
+_MAGIC = b"SOLQMAP\x00"
+_ALIGN = 64
+_ARRAYS = ("codes","depths","B")
+# the cells are located at this depth at most, so that the Morton codes of
+# the two interleaved coordinates fit in 64 bits
+_MAX_DEPTH = 30
+
+def _spread(i):
+    """
+    To insert a 0 bit after each bit of the integers i < 2^32
+    """
+    i = np.asarray(i,dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16,0x0000FFFF0000FFFF),(8,0x00FF00FF00FF00FF),(4,0x0F0F0F0F0F0F0F0F),
+                        (2,0x3333333333333333),(1,0x5555555555555555)):
+        i = (i | (i << np.uint64(shift))) & np.uint64(mask)
+    return i
+
+def _morton(i,j):
+    """
+    To compute the Morton codes of the cells (i, j), i along r and j along z
+    """
+    return _spread(i) | (_spread(j) << np.uint64(1))
+
+class AdaptiveMap:
+    """
+    To interpolate the field of a loop or a solenoid on an adaptive map
+
+    The sources are axisymmetric, so the map is a quadtree in (r, z): a cell
+    is split in four while the bilinear interpolation of its corners differs
+    from the source by more than tol at its center or at the middle of its
+    edges, and these five points become the corners of its children. The
+    field is therefore sampled finely near the winding only.
+
+    The leaves are stored as flat arrays sorted by the Morton code of their
+    first cell at maxDepth, so a point is located by a binary search on its
+    own code, for all the points at once.
+
+    * Attributes
+        - self.x0: float
+            the x position of the axis
+        - self.y0: float
+            the y position of the axis
+        - self.rmax: float
+            the largest distance from the axis covered by the map
+        - self.zmin: float
+            the z min coordinate of the map
+        - self.zmax: float
+            the z max coordinate of the map
+        - self.tol: float
+            the largest error accepted in a cell, in Tesla
+        - self.maxDepth: int
+            the largest depth of the cells
+        - self.codes: 1D np.array(uint64)
+            the sorted Morton codes of the leaves, at maxDepth
+        - self.depths: 1D np.array(uint8)
+            the depth of each leaf
+        - self.B: 3D np.array(float)
+            Br and Bz at the corners (r0,z0), (r1,z0), (r0,z1), (r1,z1)
+            of each leaf, shape (len(codes),2,4)
+        - self.error: float
+            the largest error found at the test points of the leaves
+        - self.samples: int
+            the number of points where the source was evaluated
+    """
+    def __init__(self,source,xmin,xmax,ymin,ymax,zmin,zmax,tol=1e-5,minDepth=3,maxDepth=10):
+        """
+        The constructor
+
+        * Arguments
+            - source: Loop or Solenoid
+                the object whose field is mapped
+            - xmin: float
+                the x min coordinate
+            - xmax: float
+                the x max coordinate
+            - ymin: float
+                the y min coordinate
+            - ymax: float
+                the y max coordinate
+            - zmin: float
+                the z min coordinate
+            - zmax: float
+                the z max coordinate
+            - tol: float
+                the largest error accepted in a cell, in Tesla
+            - minDepth: int
+                the depth of the initial regular grid, 2^minDepth cells
+                on each axis
+            - maxDepth: int
+                the largest depth of the cells, the cells at this depth are
+                kept even if their error is larger than tol
+
+        * Example
+            sol = Solenoid(n=100)
+            amap = AdaptiveMap(sol,-1,1,-1,1,-1,1,tol=1e-5)
+            print(amap)
+            Bx, By, Bz = amap.field(0.1,0.2,0.3)
+        """
+        minDepth = int(minDepth)
+        maxDepth = int(maxDepth)
+        if not 0 <= minDepth <= maxDepth <= _MAX_DEPTH:
+            raise ValueError("0 <= minDepth <= maxDepth <= "+str(_MAX_DEPTH)+" is required")
+        self.x0 = source.x0
+        self.y0 = source.y0
+        corners = np.array([[xmin,ymin],[xmin,ymax],[xmax,ymin],[xmax,ymax]])
+        self.rmax = float(np.max(np.sqrt((corners[:,0]-self.x0)**2+(corners[:,1]-self.y0)**2)))
+        self.zmin = float(zmin)
+        self.zmax = float(zmax)
+        self.tol = float(tol)
+        self.maxDepth = maxDepth
+        self.samples = 0
+        self.error = 0.
+
+        # the regular grid of depth minDepth
+        n = 2**minDepth
+        r, z = np.meshgrid(np.arange(n+1),np.arange(n+1),indexing="ij")
+        Br, Bz = self._sample(source,r/n,z/n)
+        nodes = np.stack([Br,Bz],axis=-1)
+        i, j = np.meshgrid(np.arange(n),np.arange(n),indexing="ij")
+        i = i.ravel()
+        j = j.ravel()
+        B = np.stack([nodes[i,j],nodes[i+1,j],nodes[i,j+1],nodes[i+1,j+1]],axis=-1)
+
+        codes = []
+        depths = []
+        leaves = []
+        for depth in range(minDepth,maxDepth+1):
+            if len(i) == 0:
+                break
+            n = 2**depth
+            # the center and the middle of the edges, in units of the cell
+            u = np.array([0.5,0.5,0.5,0,1])
+            v = np.array([0.5,0,1,0.5,0.5])
+            Br, Bz = self._sample(source,(i[:,np.newaxis]+u)/n,(j[:,np.newaxis]+v)/n)
+            tests = np.stack([Br,Bz],axis=1)
+            c0, c1, c2, c3 = (B[...,k] for k in range(4))
+            bilinear = np.stack([(c0+c1+c2+c3)/4,(c0+c1)/2,(c2+c3)/2,(c0+c2)/2,(c1+c3)/2],axis=-1)
+            error = np.max(np.sqrt(np.sum((tests-bilinear)**2,axis=1)),axis=1)
+            # nan (on the winding) is refined too, down to maxDepth
+            split = ~(error <= self.tol) if depth < maxDepth else np.zeros(len(i),dtype=bool)
+            keep = ~split
+            codes.append(_morton(i[keep],j[keep]) << np.uint64(2*(maxDepth-depth)))
+            depths.append(np.full(np.count_nonzero(keep),depth,dtype=np.uint8))
+            leaves.append(B[keep])
+            if np.any(np.isfinite(error[keep])):
+                self.error = max(self.error,float(np.nanmax(error[keep])))
+
+            # the 3x3 nodes of the split cells, then their four children
+            center, bottom, top, left, right = (tests[split][...,k] for k in range(5))
+            c0, c1, c2, c3 = (B[split][...,k] for k in range(4))
+            children = [np.stack([c0,bottom,left,center],axis=-1),
+                        np.stack([bottom,c1,center,right],axis=-1),
+                        np.stack([left,center,c2,top],axis=-1),
+                        np.stack([center,right,top,c3],axis=-1)]
+            i = np.concatenate([2*i[split]+di for di in (0,1,0,1)])
+            j = np.concatenate([2*j[split]+dj for dj in (0,0,1,1)])
+            B = np.concatenate(children)
+
+        codes = np.concatenate(codes)
+        order = np.argsort(codes)
+        self.codes = codes[order]
+        self.depths = np.concatenate(depths)[order]
+        self.B = np.ascontiguousarray(np.concatenate(leaves)[order])
+
+    def _sample(self,source,u,v):
+        """
+        To evaluate the source at points given as fractions of the map, once
+        for the points shared by neighbouring cells
+        """
+        u, v = np.broadcast_arrays(u,v)
+        points, inverse = np.unique(np.stack([u.ravel(),v.ravel()],axis=1),axis=0,return_inverse=True)
+        self.samples += len(points)
+        Br, Bz = source.field_rz(points[:,0]*self.rmax,self.zmin+points[:,1]*(self.zmax-self.zmin))
+        inverse = inverse.reshape(u.shape)
+        return Br[inverse], Bz[inverse]
+
+    def __str__(self):
+        return ("rmax = "+str(self.rmax)+", zmin = "+str(self.zmin)+", zmax = "+str(self.zmax)+
+                ", cells = "+str(len(self.codes))+", samples = "+str(self.samples)+", error = "+str(self.error))
+
+    def field_rz(self,r,z):
+        """
+        To interpolate the magnetic field in cylindrical coordinates
+
+        * Arguments
+            - r: float
+                the distance from the axis
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field, nan outside of the map
+        """
+        r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+        shape = r.shape
+        # the coordinates in units of the cells of maxDepth
+        n = 2**self.maxDepth
+        u = r.ravel()*(n/self.rmax)
+        v = (z.ravel()-self.zmin)*(n/(self.zmax-self.zmin))
+        eps = 1e-9*n
+        outside = ~((u >= -eps) & (u <= n+eps) & (v >= -eps) & (v <= n+eps))
+        u[outside] = 0
+        v[outside] = 0
+        i = np.minimum(u,n-1).astype(np.uint64)
+        j = np.minimum(v,n-1).astype(np.uint64)
+        leaf = np.searchsorted(self.codes,_morton(i,j),side="right")-1
+
+        # the position in the leaf, between 0 and 1
+        shift = (self.maxDepth-self.depths[leaf]).astype(np.uint64)
+        size = np.left_shift(np.uint64(1),shift).astype(float)
+        u -= ((i >> shift) << shift).astype(float)
+        u /= size
+        v -= ((j >> shift) << shift).astype(float)
+        v /= size
+        w = np.empty((len(u),4))
+        np.multiply(1-u,1-v,out=w[:,0])
+        np.multiply(u,1-v,out=w[:,1])
+        np.multiply(1-u,v,out=w[:,2])
+        np.multiply(u,v,out=w[:,3])
+        Br, Bz = np.einsum("nck,nk->cn",self.B[leaf],w)
+        Br[outside] = np.nan
+        Bz[outside] = np.nan
+        return Br.reshape(shape), Bz.reshape(shape)
+
+    def field(self,x,y,z):
+        """
+        To interpolate the magnetic field, as the field method of the source
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field, nan outside of the map
+
+        * Example
+            sol = Solenoid(n=100)
+            amap = AdaptiveMap(sol,-1,1,-1,1,-1,1,tol=1e-5)
+            l = np.linspace(-1,1,10)
+            x, y, z = np.meshgrid(l,l,l)
+            Bx, By, Bz = amap.field(x, y, z)
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float))
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = self.field_rz(r,z)
+        return _toCartesian(x,y,r,Br,Bz)
+
+    def save(self,filename):
+        """
+        To write the map in a binary file
+
+        The file holds a small header with the attributes, then the raw
+        arrays, aligned on 64 bytes so that load_adaptive_map can memory map
+        them.
+
+        * Arguments
+            - filename: String
+                the name of the file, ".qmap" by convention
+
+        * Example
+            sol = Solenoid(n=100)
+            AdaptiveMap(sol,-1,1,-1,1,-1,1).save("map.qmap")
+            amap = load_adaptive_map("map.qmap")
+        """
+        arrays = {}
+        offset = 0
+        for name in _ARRAYS:
+            value = np.ascontiguousarray(getattr(self,name))
+            arrays[name] = [value.dtype.newbyteorder("<").str,list(value.shape),offset]
+            offset += -(-value.nbytes//_ALIGN)*_ALIGN
+        header = {name:getattr(self,name) for name in ("x0","y0","rmax","zmin","zmax","tol","maxDepth","error","samples")}
+        header = {name:value.item() if isinstance(value,np.generic) else value for name, value in header.items()}
+        header["arrays"] = arrays
+        text = json.dumps(header).encode()
+        text += b" "*(-(len(_MAGIC)+4+len(text)) % _ALIGN)
+        with open(filename,"wb") as f:
+            f.write(_MAGIC+np.array(len(text),dtype="<u4").tobytes()+text)
+            for name in _ARRAYS:
+                data = np.ascontiguousarray(getattr(self,name)).astype(arrays[name][0],copy=False).tobytes()
+                f.write(data+b"\0"*(-len(data) % _ALIGN))
+
+def load_adaptive_map(filename):
+    """
+    To load a map written by AdaptiveMap.save
+
+    The arrays are memory mapped: they are read-only views of the file, and
+    only the leaves which are used are read.
+
+    * Arguments
+        - filename: String
+            the name of the file
+
+    * Returns
+        - amap: AdaptiveMap
+            the map, with the same field and field_rz methods
+
+    * Example
+        amap = load_adaptive_map("map.qmap")
+        Bx, By, Bz = amap.field(0.1,0.2,0.3)
+    """
+    with open(filename,"rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(str(filename)+" is not an adaptive field map")
+        size = int(np.frombuffer(f.read(4),dtype="<u4")[0])
+        header = json.loads(f.read(size).decode())
+    amap = AdaptiveMap.__new__(AdaptiveMap)
+    for name, (dtype, shape, offset) in header.pop("arrays").items():
+        setattr(amap,name,np.memmap(filename,dtype=dtype,mode="r",offset=len(_MAGIC)+4+size+offset,shape=tuple(shape)))
+    for name, value in header.items():
+        setattr(amap,name,value)
+    return amap
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from Solenoyds.Export import FieldWriter, writeField, writeFieldMap, load_field_map, _format
+
+# changed when the computation of the field changes, to invalidate the entries
+_VERSION = "1"
+
+def _geometry(source):
+    """
+    To get the parameters of an object which define its field
+
+    * Arguments
+        - source: Loop, Solenoid...
+            the object
+
+    * Returns
+        - geometry: dict
+            its class name, its attributes which are numbers or strings, and
+            the hash of its attributes which are arrays (such as the turns)
+    """
+    geometry = {"class":type(source).__name__}
+    for name, value in sorted(vars(source).items()):
+        if isinstance(value,(bool,int,float,str,np.number)):
+            geometry[name] = value.item() if isinstance(value,np.number) else value
+        elif isinstance(value,np.ndarray):
+            value = np.ascontiguousarray(value)
+            geometry[name] = [str(value.dtype),value.shape,hashlib.sha256(value.data).hexdigest()]
+    return geometry
+
+class FieldCache:
+    """
+    To keep the fields already computed, identified by a hash of the geometry
+    of the source and of the points (or of the definition of the grid)
+
+    The fields are kept in memory, in a least recently used list limited by
+    maxMemory, and, if a directory is given, on disk as .fmap files which
+    are memory mapped when they are read back. When the files take more than
+    maxDisk bytes, the least recently used ones are removed.
+
+    A cache is used by setting the attribute cache of a Loop or a Solenoid,
+    and can be shared by several objects. The arrays it returns are read-only.
+
+    * Attributes
+        - self.directory: String
+            the directory of the files, None to keep the fields in memory only
+        - self.maxMemory: float
+            the largest size in bytes of the fields kept in memory
+        - self.maxDisk: float
+            the largest size in bytes of the files
+        - self.hits: int
+            number of fields found in the cache
+        - self.misses: int
+            number of fields computed
+    """
+    def __init__(self,directory=None,maxMemory=2**28,maxDisk=2**32):
+        """
+        The constructor
+
+        * Arguments
+            - directory: String
+                the directory of the files, created if needed,
+                None to keep the fields in memory only
+            - maxMemory: float
+                the largest size in bytes of the fields kept in memory
+            - maxDisk: float
+                the largest size in bytes of the files
+
+        * Example
+            sol = Solenoid(n=1000)
+            sol.cache = FieldCache("field_cache")
+            Bx, By, Bz = sol.field(x,y,z)
+            Bx, By, Bz = sol.field(x,y,z) # read from the cache
+        """
+        self.directory = directory
+        self.maxMemory = maxMemory
+        self.maxDisk = maxDisk
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memorySize = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory,exist_ok=True)
+
+    def __str__(self):
+        return "directory = "+str(self.directory)+", entries in memory = "+str(len(self._memory))+", hits = "+str(self.hits)+", misses = "+str(self.misses)
+
+    def key(self,source,*arguments):
+        """
+        To compute the key of a field
+
+        * Arguments
+            - source: Loop, Solenoid...
+                the object producing the field
+            - arguments: np.array(float) or dict
+                the coordinates of the points, or the definition of a grid
+
+        * Returns
+            - key: String
+                the hexadecimal SHA-256 of the geometry and the arguments
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps([_VERSION,_geometry(source)],sort_keys=True).encode())
+        for argument in arguments:
+            if isinstance(argument,dict):
+                h.update(json.dumps(argument,sort_keys=True).encode())
+            else:
+                argument = np.ascontiguousarray(argument,dtype=float)
+                h.update(str(argument.shape).encode())
+                h.update(argument.data if argument.size else b"")
+        return h.hexdigest()
+
+    def _path(self,key):
+        return os.path.join(self.directory,key+".fmap")
+
+    def get(self,key):
+        """
+        To look for a field in the cache
+
+        * Arguments
+            - key: String
+                the key of the field
+
+        * Returns
+            - B: (np.array(float),np.array(float),np.array(float))
+                the field, None if it is not in the cache
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        fieldMap = load_field_map(self._path(key),"raw")
+        # the modification time orders the files for the eviction
+        os.utime(self._path(key))
+        shape = tuple(fieldMap["grid"]["shape"])
+        B = tuple(fieldMap[name].reshape(shape) for name in ("Bx","By","Bz"))
+        with self._lock:
+            self.hits += 1
+        self._remember(key,B)
+        return B
+
+    def put(self,key,x,y,z,Bx,By,Bz):
+        """
+        To add a field to the cache
+
+        * Arguments
+            - key: String
+                the key of the field
+            - x, y, z: np.array(float)
+                the coordinates of the points
+            - Bx, By, Bz: np.array(float)
+                the magnetic field
+
+        * Returns
+            - B: (np.array(float),np.array(float),np.array(float))
+                the read-only arrays kept in the cache
+        """
+        B = tuple(np.array(b,dtype=np.result_type(b,np.float32)) for b in (Bx,By,Bz))
+        for b in B:
+            b.flags.writeable = False
+        if self.directory is not None:
+            x, y, z = np.broadcast_arrays(x,y,z,B[0])[:3]
+            self._store(key,lambda f: writeField(f,x,y,z,*B,{"shape":list(B[0].shape)},"raw"))
+        self._remember(key,B)
+        return B
+
+    def _remember(self,key,B):
+        """
+        To keep a field in memory, removing the least recently used ones
+        """
+        size = sum(b.nbytes for b in B)
+        if size > self.maxMemory:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = B
+            self._memorySize += size
+            while self._memorySize > self.maxMemory:
+                _, old = self._memory.popitem(last=False)
+                self._memorySize -= sum(b.nbytes for b in old)
+
+    def _store(self,key,write):
+        """
+        To write a file of the cache, renamed once complete, and to remove
+        the least recently used files beyond maxDisk
+        """
+        fd, temporary = tempfile.mkstemp(suffix=".tmp",dir=self.directory)
+        os.close(fd)
+        try:
+            write(temporary)
+            os.replace(temporary,self._path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".fmap"):
+                stat = entry.stat()
+                files.append((stat.st_mtime,stat.st_size,entry.path))
+        total = sum(f[1] for f in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.maxDisk:
+                break
+            if path == self._path(key):
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        To remove all the fields from the memory and from the directory
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memorySize = 0
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".fmap"):
+                    os.remove(entry.path)
+
+    def field(self,source,field,x,y,z,dtype=np.float64):
+        """
+        To get a field from the cache, or to compute and keep it
+
+        * Arguments
+            - source: Loop, Solenoid...
+                the object producing the field
+            - field: function
+                field(x,y,z) computes Bx, By, Bz
+            - x, y, z: np.array(float)
+                the coordinates of the points
+            - dtype: np.dtype
+                the precision of the field
+
+        * Returns
+            - Bx, By, Bz: (np.array(float),np.array(float),np.array(float))
+                the magnetic field, read-only
+        """
+        key = self.key(source,x,y,z,{"dtype":np.dtype(dtype).str})
+        B = self.get(key)
+        if B is None:
+            with self._lock:
+                self.misses += 1
+            B = self.put(key,x,y,z,*field(x,y,z))
+        return B
+
+    def exportFieldMap(self,source,field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,
+                       format=None,precision=None,slabSize=2**20,progress=None,dtype=np.float64):
+        """
+        To export a field map, copied from the cache if it was already computed
+
+        The map is kept as a .fmap file of the directory, and converted to
+        the format of filename slab by slab. Without directory, the map is
+        computed and written as by writeFieldMap.
+
+        * Arguments
+            - source: Loop, Solenoid...
+                the object producing the field
+            - field: function
+                field(x,y,z) computes Bx, By, Bz
+            - the other arguments: see writeFieldMap
+        """
+        args = (xmin,xmax,ymin,ymax,zmin,zmax,nb_points)
+        if self.directory is None:
+            writeFieldMap(field,filename,*args,format,precision,slabSize,progress,dtype)
+            return
+        grid = {"xmin":float(xmin),"xmax":float(xmax),"ymin":float(ymin),"ymax":float(ymax),
+                "zmin":float(zmin),"zmax":float(zmax),"nb_points":int(nb_points)}
+        key = self.key(source,grid,{"dtype":np.dtype(dtype).str})
+        path = self._path(key)
+        n = int(nb_points)**3
+        if os.path.exists(path):
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            if progress is not None:
+                progress(n,n)
+        else:
+            with self._lock:
+                self.misses += 1
+            self._store(key,lambda f: writeFieldMap(field,f,*args,"raw",None,slabSize,progress,dtype))
+
+        if _format(filename,format) == "raw":
+            shutil.copyfile(path,filename)
+        else:
+            fieldMap = load_field_map(path,"raw")
+            slabSize = max(1,int(slabSize))
+            with FieldWriter(filename,n,grid,format,precision,dtype) as writer:
+                for i in range(0,n,slabSize):
+                    writer.write(*(fieldMap[name][i:i+slabSize] for name in ("x","y","z","Bx","By","Bz")))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+from Solenoyds.Loop import _fieldRZ, _turnArrays, _BYTES_PER_PAIR
+from Solenoyds.Export import writeField, writeFieldMap
+
+# approximate size in bytes of the arrays of CoilSystem.field for one
+# (element, point) pair: the local coordinates, the fields and the rotations
+_BYTES_PER_ELEMENT_POINT = 16*8
+
+def _rotation(axis):
+    """
+    To compute the rotation which brings the z axis on a given direction
+
+    * Arguments
+        - axis: (float,float,float)
+            the direction
+
+    * Returns
+        - R: 2D np.array(float)
+            the 3x3 rotation matrix, whose columns are the local x, y and z
+            axes in the global frame
+    """
+    w = np.asarray(axis,dtype=float)
+    w = w/np.linalg.norm(w)
+    if w[2] < 0:
+        # 1/(1+c) is not accurate near -z: the rotation by pi about x is
+        # composed with the rotation of (0,0,1) onto its image of w
+        flip = np.diag([1.,-1.,-1.])
+        return flip@_rotation(flip@w)
+    # Rodrigues formula for the rotation of (0,0,1) onto w
+    k = np.array([[0,0,w[0]],[0,0,w[1]],[-w[0],-w[1],0]])
+    return np.eye(3)+k+k@k/(1+w[2])
+
+class CoilSystem:
+    """
+    To combine loops and solenoids with arbitrary positions and orientations
+
+    Each element is rotated about its center (x0, y0, z0) so that its axis
+    points along a given direction. The query points are brought into the
+    frames of all the elements with one batched product by the rotation
+    matrices, all the turns of all the elements are evaluated together, and
+    the fields are rotated back and summed. The points are processed by
+    blocks, so that the arrays of all the elements and the temporaries of the
+    turns stay under maxMemory.
+
+    * Attributes
+        - self.elements: list(Loop or Solenoid)
+            the elements
+        - self.centers: 2D np.array(float)
+            the centers of the elements, shape (M,3)
+        - self.rotations: 3D np.array(float)
+            the rotation matrices of the elements, shape (M,3,3)
+    """
+    def __init__(self,elements=()):
+        """
+        The constructor
+
+        * Arguments
+            - elements: list(Loop or Solenoid)
+                elements whose axis is the z axis
+
+        * Example
+            coils = CoilSystem()
+            coils.add(Solenoid(n=100,z0=-2))
+            coils.add(Loop(0.1,x0=1),axis=(1,0,0))
+            Bx, By, Bz = coils.field(0,0,0)
+        """
+        self.elements = []
+        self.centers = np.zeros((0,3))
+        self.rotations = np.zeros((0,3,3))
+        self._turns = None
+        for element in elements:
+            self.add(element)
+
+    def __str__(self):
+        return "M = "+str(len(self.elements))+", "+", ".join(type(e).__name__ for e in self.elements)
+
+    def add(self,element,axis=(0,0,1)):
+        """
+        To add an element
+
+        * Arguments
+            - element: Loop or Solenoid
+                the element, built along the z axis
+            - axis: (float,float,float)
+                the direction of the axis of the element, around its center
+
+        * Returns
+            - index: int
+                the index of the element in self.elements
+
+        * Example
+            coils = CoilSystem()
+            coils.add(Solenoid(n=100,x0=1,z0=2),axis=(0,1,1))
+        """
+        self.elements.append(element)
+        center = np.array([[element.x0,element.y0,element.z0]],dtype=float)
+        self.centers = np.concatenate([self.centers,center])
+        self.rotations = np.concatenate([self.rotations,_rotation(axis)[np.newaxis]])
+        self._turns = None
+        return len(self.elements)-1
+
+    def _gatherTurns(self):
+        """
+        To gather the turns of all the elements made of loops, sorted by element
+        """
+        frame, B0, r0, z0, others = [], [], [], [], []
+        for m, element in enumerate(self.elements):
+            if getattr(element,"model","loops") != "loops":
+                others.append(m)
+                continue
+            strengths, radii, positions = _turnArrays(element)
+            frame.append(np.full(len(radii),m))
+            B0.append(strengths)
+            r0.append(radii)
+            z0.append(positions-element.z0)
+        if frame:
+            self._turns = tuple(np.concatenate(v).astype(t) for v, t in
+                                ((frame,int),(B0,float),(r0,float),(z0,float)))
+        else:
+            self._turns = (np.zeros(0,int),np.zeros(0),np.zeros(0),np.zeros(0))
+        self._others = others
+
+    def field(self,x,y,z,maxMemory=1e8):
+        """
+        To compute the magnetic field produced by all the elements
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+            - maxMemory: float
+                maximum memory in bytes used by the temporary arrays
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field
+
+        * Example
+            coils = CoilSystem([Solenoid(n=100)])
+            l = np.linspace(-1,1,10)
+            x, y, z = np.meshgrid(l,l,l)
+            Bx, By, Bz = coils.field(x, y, z)
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float),
+                                      np.asarray(y,dtype=float),
+                                      np.asarray(z,dtype=float))
+        shape = x.shape
+        points = np.stack([x.ravel(),y.ravel(),z.ravel()],axis=1)
+        if self._turns is None:
+            self._gatherTurns()
+
+        # half of maxMemory for the arrays of all the elements, (M,P,...), and
+        # half for the temporaries of the turns
+        step = max(1,int(maxMemory/2//(_BYTES_PER_ELEMENT_POINT*max(1,len(self.elements)))))
+        B = np.zeros(points.shape)
+        for i in range(0,len(points),step):
+            B[i:i+step] = self._fieldBlock(points[i:i+step],maxMemory/2)
+        return B[:,0].reshape(shape), B[:,1].reshape(shape), B[:,2].reshape(shape)
+
+    def _fieldBlock(self,points,maxMemory):
+        """
+        To compute the magnetic field produced by all the elements in a block
+        of points, shape (P,3)
+        """
+        frame, B0, r0, z0 = self._turns
+
+        # coordinates of the points in the frames of all the elements, (M,P,3)
+        local = np.einsum("mji,mpj->mpi",self.rotations,points[np.newaxis]-self.centers[:,np.newaxis])
+        r = np.sqrt(local[...,0]**2+local[...,1]**2)
+        Br = np.zeros(r.shape)
+        Bz = np.zeros(r.shape)
+
+        pairs = max(1,int(maxMemory//_BYTES_PER_PAIR))
+        turnStep = max(1,min(len(frame),pairs))
+        pointStep = max(1,pairs//turnStep)
+        for i in range(0,len(points),pointStep):
+            block = slice(i,i+pointStep)
+            for j in range(0,len(frame),turnStep):
+                turns = slice(j,j+turnStep)
+                f = frame[turns]
+                br, bz = _fieldRZ(B0[turns,np.newaxis],r0[turns,np.newaxis],
+                                  r[f,block],local[f,block,2]-z0[turns,np.newaxis])
+                # the turns are sorted by element, sum them element by element
+                starts = np.flatnonzero(np.r_[True,f[1:] != f[:-1]])
+                Br[f[starts],block] += np.add.reduceat(br,starts,axis=0)
+                Bz[f[starts],block] += np.add.reduceat(bz,starts,axis=0)
+        for m in self._others:
+            element = self.elements[m]
+            br, bz = element.field_rz(r[m],local[m,:,2]+element.z0)
+            Br[m] += br
+            Bz[m] += bz
+
+        c = np.divide(local[...,0],r,out=np.zeros(r.shape),where=r!=0)
+        s = np.divide(local[...,1],r,out=np.zeros(r.shape),where=r!=0)
+        return np.einsum("mij,mpj->pi",self.rotations,np.stack([Br*c,Br*s,Bz],axis=-1))
+
+    def exportFieldMap(self,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format=None,precision=None,slabSize=2**20,progress=None):
+        """
+        To export a field map as a .txt, .npy, .npz or .fmap file, as
+        Solenoid.exportFieldMap
+
+        * Example
+            coils = CoilSystem([Solenoid(n=50)])
+            coils.exportFieldMap("output_map.fmap",-1,1,-1,1,-1,1,20)
+        """
+        writeFieldMap(self.field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format,precision,slabSize,progress)
+
+    def exportField(self,filename,x,y,z,format=None,precision=None):
+        """
+        To export the field computed in some points as a .txt, .npy, .npz or
+        .fmap file, as Solenoid.exportField
+
+        * Example
+            z = np.linspace(-2,2,20)
+            coils = CoilSystem([Solenoid(n=40)])
+            coils.exportField("output.txt",0*z,0*z,z)
+        """
+        Bx, By, Bz = self.field(x,y,z)
+        writeField(filename,x,y,z,Bx,By,Bz,None,format,precision)
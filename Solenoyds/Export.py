@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+
+To compute field maps slab by slab, to write the field computed in some
+points and to load it back
+
+Four formats are available, chosen from the extension of the file name:
+    - ".txt" (or any other extension): one line x;y;z;Bx;By;Bz per point
+    - ".npy": a (6,n) array whose rows are x, y, z, Bx, By, Bz
+    - ".npz": the arrays x, y, z, Bx, By, Bz and the grid metadata
+    - ".fmap": a raw (6,n) float64 (or float32) array after a small header
+      holding the grid metadata, which can be memory mapped
+"""
+import os
+import json
+import tempfile
+import zipfile
+import numpy as np
+
+_MAGIC = b"SOLFMAP\x00"
+_ALIGN = 64
+_NAMES = ("x","y","z","Bx","By","Bz")
+# number of lines formatted at once in the text format
+_TEXT_CHUNK = 65536
+
+def _format(filename,format=None):
+    """
+    To choose the format of a file from its extension
+
+    * Arguments
+        - filename: String
+            the name of the file
+        - format: String
+            "txt", "npy", "npz" or "raw", None to use the extension
+
+    * Returns
+        - format: String
+            the format of the file
+    """
+    if format is None:
+        ext = str(filename).rsplit(".",1)[-1].lower()
+        format = {"npy":"npy","npz":"npz","fmap":"raw"}.get(ext,"txt")
+    if format not in ("txt","npy","npz","raw"):
+        raise ValueError("format must be \"txt\", \"npy\", \"npz\" or \"raw\"")
+    return format
+
+def _header(n,grid,dtype="<f8"):
+    """
+    To build the header of the raw format, padded to a multiple of 64 bytes
+    """
+    text = json.dumps({"dtype":dtype,"shape":[len(_NAMES),n],"grid":grid}).encode()
+    size = len(_MAGIC)+4+len(text)
+    text += b" "*(-size % _ALIGN)
+    return _MAGIC+np.array(len(text),dtype="<u4").tobytes()+text
+
+class FieldWriter:
+    """
+    To write the field computed in some points, slab by slab
+
+    The number of points is known in advance, so the binary formats are
+    written in place through a memory map and only the current slab is held
+    in memory. The npz format goes through a temporary raw file which is
+    copied into the archive by blocks when the writer is closed.
+
+    * Attributes
+        - self.filename: String
+            the name of the output file
+        - self.n: int
+            the total number of points
+        - self.count: int
+            the number of points already written
+        - self.grid: dict
+            the definition of the grid
+        - self.format: String
+            "txt", "npy", "npz" or "raw"
+        - self.precision: int
+            number of significant digits in the text format
+        - self.dtype: np.dtype
+            the little-endian type of the values in the binary formats
+    """
+    def __init__(self,filename,n,grid=None,format=None,precision=None,dtype=np.float64):
+        """
+        The constructor
+
+        * Arguments
+            - filename: String
+                the name of the output file
+            - n: int
+                the total number of points
+            - grid: dict
+                the definition of the grid (xmin, xmax, ymin, ymax, zmin, zmax,
+                nb_points), stored in the npz and raw formats
+            - format: String
+                "txt", "npy", "npz" or "raw", None to use the extension
+            - precision: int
+                number of significant digits in the text format,
+                None for the shortest representation giving back the same float
+            - dtype: np.dtype
+                np.float64, or np.float32 to write the values in single
+                precision (9 significant digits by default in the text format)
+
+        * Example
+            with FieldWriter("output.fmap",len(x)) as writer:
+                writer.write(x,y,z,Bx,By,Bz)
+        """
+        self.filename = filename
+        self.n = int(n)
+        self.count = 0
+        self.grid = grid
+        self.format = _format(filename,format)
+        self.precision = precision
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self._temporary = None
+
+        shape = (len(_NAMES),self.n)
+        if self.format == "npy":
+            self._data = np.lib.format.open_memmap(filename,mode="w+",dtype=self.dtype,shape=shape)
+        elif self.format == "raw":
+            header = _header(self.n,grid,self.dtype.str)
+            with open(filename,'wb') as f:
+                f.write(header)
+                f.truncate(len(header)+self.dtype.itemsize*len(_NAMES)*self.n)
+            self._data = np.memmap(filename,dtype=self.dtype,mode="r+",offset=len(header),shape=shape)
+        elif self.format == "npz":
+            directory = os.path.dirname(os.path.abspath(filename))
+            fd, self._temporary = tempfile.mkstemp(suffix=".fmap",dir=directory)
+            os.close(fd)
+            self._data = np.memmap(self._temporary,dtype=self.dtype,mode="w+",shape=shape)
+        else:
+            if precision is None and self.dtype.itemsize == 4:
+                # enough digits to give back the same float32
+                precision = 9
+            conversion = "%r" if precision is None else "%."+str(int(precision))+"g"
+            self._line = ";".join([conversion]*len(_NAMES))+"\n"
+            self._file = open(filename,'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def write(self,x,y,z,Bx,By,Bz):
+        """
+        To append the field computed in some points
+
+        * Arguments
+            - x, y, z: 1D np.array(float)
+                the coordinates
+            - Bx, By, Bz: 1D np.array(float)
+                the magnetic field
+        """
+        slab = np.stack([np.ravel(np.asarray(v,dtype=self.dtype)) for v in (x,y,z,Bx,By,Bz)])
+        size = slab.shape[1]
+        if self.count+size > self.n:
+            raise ValueError("more than "+str(self.n)+" points written in "+str(self.filename))
+        if self.format == "txt":
+            for i in range(0,size,_TEXT_CHUNK):
+                block = slab[:,i:i+_TEXT_CHUNK].T
+                self._file.write((self._line*len(block)) % tuple(block.ravel().tolist()))
+        else:
+            self._data[:,self.count:self.count+size] = slab
+        self.count += size
+
+    def close(self):
+        """
+        To finish the file
+        """
+        if self.format == "txt":
+            self._file.close()
+            return
+        self._data.flush()
+        if self.format == "npz":
+            with zipfile.ZipFile(self.filename,'w',allowZip64=True) as archive:
+                for name, row in zip(_NAMES,self._data):
+                    with archive.open(name+".npy",'w',force_zip64=True) as f:
+                        np.lib.format.write_array_header_1_0(f,{"descr":self.dtype.str,"fortran_order":False,"shape":(self.n,)})
+                        for i in range(0,self.n,_TEXT_CHUNK):
+                            f.write(np.ascontiguousarray(row[i:i+_TEXT_CHUNK]).tobytes())
+                with archive.open("grid.npy",'w') as f:
+                    np.save(f,np.array(json.dumps(self.grid)))
+            del self._data
+            os.remove(self._temporary)
+        else:
+            del self._data
+
+def writeField(filename,x,y,z,Bx,By,Bz,grid=None,format=None,precision=None,dtype=None):
+    """
+    To write the field computed in some points
+
+    * Arguments
+        - filename: String
+            the name of the output file
+        - x, y, z: 1D np.array(float)
+            the coordinates
+        - Bx, By, Bz: 1D np.array(float)
+            the magnetic field
+        - grid: dict
+            the definition of the grid (xmin, xmax, ymin, ymax, zmin, zmax,
+            nb_points), stored in the npz and raw formats
+        - format: String
+            "txt", "npy", "npz" or "raw", None to use the extension
+        - precision: int
+            number of significant digits in the text format,
+            None for the shortest representation giving back the same float
+        - dtype: np.dtype
+            the type of the values, None for the type of the field
+
+    * Example
+        writeField("output.fmap",x,y,z,Bx,By,Bz)
+    """
+    if dtype is None:
+        dtype = np.result_type(Bx,By,Bz,np.float32)
+    with FieldWriter(filename,np.size(x),grid,format,precision,dtype) as writer:
+        writer.write(x,y,z,Bx,By,Bz)
+
+def fieldMapSlabs(field,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize=2**20):
+    """
+    To compute a field map slab by slab
+
+    The points are generated in the order of exportFieldMap (y, then x, then
+    z) directly from their flat index, so the memory used only depends on
+    slabSize.
+
+    * Arguments
+        - field: function
+            field(x,y,z) returns Bx, By, Bz
+        - xmin, xmax, ymin, ymax, zmin, zmax: float
+            the bounding box of the map
+        - nb_points: int
+            number of points of evaluation on each axis
+        - slabSize: int
+            number of points in each slab
+
+    * Yields
+        - x, y, z, Bx, By, Bz: 1D np.array(float)
+            the coordinates and the magnetic field of the points of a slab
+
+    * Example
+        sol = Solenoid(n=50)
+        for x, y, z, Bx, By, Bz in fieldMapSlabs(sol.field,-1,1,-1,1,-1,1,100):
+            print(np.max(np.abs(Bz)))
+    """
+    nb_points = int(nb_points)
+    xs = np.linspace(xmin,xmax,nb_points)
+    ys = np.linspace(ymin,ymax,nb_points)
+    zs = np.linspace(zmin,zmax,nb_points)
+    slabSize = max(1,int(slabSize))
+    for i in range(0,nb_points**3,slabSize):
+        iy, ix, iz = np.unravel_index(np.arange(i,min(i+slabSize,nb_points**3)),(nb_points,)*3)
+        x = xs[ix]
+        y = ys[iy]
+        z = zs[iz]
+        yield (x,y,z)+tuple(field(x,y,z))
+
+def writeFieldMap(field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,
+                  format=None,precision=None,slabSize=2**20,progress=None,dtype=np.float64):
+    """
+    To compute and write a field map slab by slab, with a memory use which
+    only depends on slabSize
+
+    * Arguments
+        - field: function
+            field(x,y,z) returns Bx, By, Bz
+        - filename: String
+            the name of the output file
+        - xmin, xmax, ymin, ymax, zmin, zmax: float
+            the bounding box of the map
+        - nb_points: int
+            number of points of evaluation on each axis
+        - format: String
+            "txt", "npy", "npz" or "raw", None to use the extension
+        - precision: int
+            number of significant digits in the text format
+        - slabSize: int
+            number of points in each slab
+        - progress: function
+            progress(done,total) is called after each slab with the number
+            of points written and the total number of points
+        - dtype: np.dtype
+            the type of the values written
+    """
+    grid = {"xmin":float(xmin),"xmax":float(xmax),"ymin":float(ymin),"ymax":float(ymax),
+            "zmin":float(zmin),"zmax":float(zmax),"nb_points":int(nb_points)}
+    with FieldWriter(filename,int(nb_points)**3,grid,format,precision,dtype) as writer:
+        for slab in fieldMapSlabs(field,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize):
+            writer.write(*slab)
+            if progress is not None:
+                progress(writer.count,writer.n)
+
+def load_field_map(filename,format=None):
+    """
+    To load a field written by exportFieldMap, exportField or writeField
+
+    The npy and raw formats are memory mapped: the arrays are read-only views
+    of the file, and nothing is read before they are used.
+
+    * Arguments
+        - filename: String
+            the name of the file
+        - format: String
+            "txt", "npy", "npz" or "raw", None to use the extension
+
+    * Returns
+        - fieldMap: dict
+            the 1D arrays "x", "y", "z", "Bx", "By", "Bz" and the dict
+            "grid" of the grid definition (None if unknown)
+
+    * Example
+        sol = Solenoid(n=50)
+        sol.exportFieldMap("output_map.fmap",-1,1,-1,1,-1,1,20)
+        fieldMap = load_field_map("output_map.fmap")
+        Bz = fieldMap["Bz"]
+    """
+    format = _format(filename,format)
+    grid = None
+    if format == "npy":
+        data = np.load(filename,mmap_mode="r")
+    elif format == "npz":
+        with np.load(filename) as f:
+            data = [f[name] for name in _NAMES]
+            grid = json.loads(str(f["grid"]))
+    elif format == "raw":
+        with open(filename,'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(str(filename)+" is not a raw field map")
+            size = int(np.frombuffer(f.read(4),dtype="<u4")[0])
+            header = json.loads(f.read(size).decode())
+        grid = header["grid"]
+        data = np.memmap(filename,dtype=header["dtype"],mode="r",
+                         offset=len(_MAGIC)+4+size,shape=tuple(header["shape"]))
+    else:
+        data = np.loadtxt(filename,delimiter=";",ndmin=2).T
+
+    fieldMap = dict(zip(_NAMES,data))
+    fieldMap["grid"] = grid
+    return fieldMap
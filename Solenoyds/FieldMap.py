@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+from scipy import ndimage
+from Solenoyds.Loop import _toCartesian, _turnArrays
+
+# the cells whose center is farther than this number of cells from all the
+# turns are away from the winding, see FieldMap.errorAway
+_WINDING_CELLS = 4
+
+def _fillNonFinite(B):
+    """
+    To replace the non-finite nodes of a grid (on a wire) by the mean of
+    their finite neighbours, layer by layer, so that a spline prefilter does
+    not spread them over the whole grid
+
+    * Arguments
+        - B: 2D np.array(float)
+            the values of the nodes, modified in place
+
+    * Returns
+        - bad: 2D np.array(bool)
+            the nodes which were not finite
+    """
+    bad = ~np.isfinite(B)
+    missing = bad.copy()
+    kernel = np.ones((3,3))
+    while missing.any() and not missing.all():
+        total = ndimage.convolve(np.where(missing,0.,B),kernel,mode="nearest")
+        count = ndimage.convolve((~missing).astype(float),kernel,mode="nearest")
+        filled = missing & (count > 0)
+        B[filled] = total[filled]/count[filled]
+        missing &= ~filled
+    return bad
+
+class FieldMap:
+    """
+    To interpolate the field of a loop or a solenoid on a precomputed map
+
+    The sources are axisymmetric, so the map is stored on a regular (r, z)
+    grid which is evaluated once, with two extra nodes on each side so that
+    the interpolation stencil never leaves the grid inside the bounding box.
+
+    * Attributes
+        - self.x0: float
+            the x position of the axis
+        - self.y0: float
+            the y position of the axis
+        - self.rmax: float
+            the largest distance from the axis covered by the map
+        - self.zmin: float
+            the z min coordinate of the map
+        - self.zmax: float
+            the z max coordinate of the map
+        - self.r: 1D np.array(float)
+            the r coordinates of the nodes
+        - self.z: 1D np.array(float)
+            the z coordinates of the nodes
+        - self.B: 3D np.array(float)
+            the interpolation coefficients of Br and Bz, shape (2,len(r),len(z))
+        - self.order: int
+            1 for a linear interpolation, 3 for a cubic one
+        - self.error: float
+            the largest difference found between the map and the source
+            in the middle of the cells, without the cells next to the nodes
+            where the field is not finite (on a wire): a worst case, reached
+            in the cells just next to the winding
+        - self.errorAway: float
+            the same largest difference, in the cells farther than 4 cells
+            from all the turns, the accuracy of the map away from the
+            winding
+    """
+    def __init__(self,source,xmin,xmax,ymin,ymax,zmin,zmax,nb_points=100,order=3):
+        """
+        The constructor
+
+        * Arguments
+            - source: Loop or Solenoid
+                the object whose field is mapped
+            - xmin: float
+                the x min coordinate
+            - xmax: float
+                the x max coordinate
+            - ymin: float
+                the y min coordinate
+            - ymax: float
+                the y max coordinate
+            - zmin: float
+                the z min coordinate
+            - zmax: float
+                the z max coordinate
+            - nb_points: int
+                number of nodes on the r and z axes
+            - order: int
+                1 for a linear (bilinear in r, z) interpolation,
+                3 for a cubic one, whose nodes on a wire are replaced by
+                the mean of their neighbours
+
+        * Example
+            sol = Solenoid(n=100)
+            fmap = FieldMap(sol,-1,1,-1,1,-1,1,200)
+            print(fmap.error, fmap.errorAway)
+            Bx, By, Bz = fmap.field(0.1,0.2,0.3)
+        """
+        if order not in (1,3):
+            raise ValueError("order must be 1 or 3")
+        nb_points = int(nb_points)
+        self.x0 = source.x0
+        self.y0 = source.y0
+        self.order = order
+
+        corners = np.array([[xmin,ymin],[xmin,ymax],[xmax,ymin],[xmax,ymax]])
+        self.rmax = np.max(np.sqrt((corners[:,0]-self.x0)**2+(corners[:,1]-self.y0)**2))
+        self.zmin = zmin
+        self.zmax = zmax
+        self._dr = self.rmax/(nb_points-1)
+        self._dz = (zmax-zmin)/(nb_points-1)
+
+        k = np.arange(-2,nb_points+2)
+        self.r = k*self._dr
+        self.z = zmin+k*self._dz
+        r, z = np.meshgrid(self.r,self.z,indexing="ij")
+        Br, Bz = source.field_rz(np.abs(r),z)
+        # Br is odd in r, which gives the nodes on the other side of the axis
+        Br = np.where(r < 0,-Br,Br)
+        B = np.ascontiguousarray(np.stack([Br,Bz]),dtype=float)
+        bad = ~np.isfinite(B[0]) | ~np.isfinite(B[1])
+        if order == 3:
+            for i in range(2):
+                _fillNonFinite(B[i])
+                B[i] = ndimage.spline_filter(B[i],order=3,mode="mirror")
+        self.B = B
+
+        rc, zc = np.meshgrid(self.r[2:-3]+self._dr/2,self.z[2:-3]+self._dz/2,indexing="ij")
+        Br, Bz = source.field_rz(rc,zc)
+        br, bz = self.field_rz(rc,zc)
+        error = np.sqrt((Br-br)**2+(Bz-bz)**2)
+        # the cells whose interpolation stencil has a node on a wire are left out
+        cells = nb_points-1
+        near = np.zeros((cells,cells),dtype=bool)
+        stencil = range(-1,3) if order == 3 else range(0,2)
+        for i in stencil:
+            for j in stencil:
+                near |= bad[2+i:2+i+cells,2+j:2+j+cells]
+        valid = ~near & np.isfinite(error)
+        self.error = np.max(error[valid]) if valid.any() else np.nan
+
+        # the distance in cells to the turns, on a grid of cells padded so
+        # that the turns just out of the map are counted
+        pad = _WINDING_CELLS+1
+        _, r0, z0 = _turnArrays(source)
+        i = np.floor(r0/self._dr).astype(int)+pad
+        j = np.floor((z0-zmin)/self._dz).astype(int)+pad
+        inside = (i >= 0) & (i < cells+2*pad) & (j >= 0) & (j < cells+2*pad)
+        wires = np.ones((cells+2*pad,cells+2*pad),dtype=bool)
+        wires[i[inside],j[inside]] = False
+        away = ndimage.distance_transform_edt(wires)[pad:-pad,pad:-pad] > _WINDING_CELLS
+        self.errorAway = np.max(error[valid & away]) if (valid & away).any() else np.nan
+
+    def __str__(self):
+        return "rmax = "+str(self.rmax)+", zmin = "+str(self.zmin)+", zmax = "+str(self.zmax)+", order = "+str(self.order)+", error = "+str(self.error)+", errorAway = "+str(self.errorAway)
+
+    def field_rz(self,r,z):
+        """
+        To interpolate the magnetic field in cylindrical coordinates
+
+        * Arguments
+            - r: float
+                the distance from the axis
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field, nan outside of the map
+        """
+        r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+        coords = np.stack([r.ravel()/self._dr+2,(z.ravel()-self.zmin)/self._dz+2])
+        Br = ndimage.map_coordinates(self.B[0],coords,order=self.order,prefilter=False,mode="mirror")
+        Bz = ndimage.map_coordinates(self.B[1],coords,order=self.order,prefilter=False,mode="mirror")
+        eps = 1e-9*max(self.rmax,self.zmax-self.zmin)
+        outside = (r.ravel() > self.rmax+eps) | (z.ravel() < self.zmin-eps) | (z.ravel() > self.zmax+eps)
+        Br[outside] = np.nan
+        Bz[outside] = np.nan
+        return Br.reshape(r.shape), Bz.reshape(r.shape)
+
+    def field(self,x,y,z):
+        """
+        To interpolate the magnetic field, as the field method of the source
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field, nan outside of the map
+
+        * Example
+            sol = Solenoid(n=100)
+            fmap = FieldMap(sol,-1,1,-1,1,-1,1,200)
+            l = np.linspace(-1,1,10)
+            x, y, z = np.meshgrid(l,l,l)
+            Bx, By, Bz = fmap.field(x, y, z)
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float))
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = self.field_rz(r,z)
+        return _toCartesian(x,y,r,Br,Bz)
@@ -6,10 +6,451 @@ https://github.com/sniang/Solenoyds
 https://sniang.github.io/Solenoyds
 """
 import numpy as np
-from scipy import special
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.pyplot as plt
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from Solenoyds.Export import writeField, writeFieldMap, fieldMapSlabs
+from Solenoyds import Stats
+
+# number of elements processed at once by the elliptic kernels, small enough
+# for their temporaries to stay in the cache of the processor
+_ELLIPTIC_CHUNK = 2**14
+
+def _agmSteps(kc2):
+    """
+    To get the number of steps of the arithmetic-geometric mean of 1 and kc
+    needed to reach double precision
+
+    The convergence is slowest for the smallest kc, so the number of steps
+    for the smallest value of an array is enough for the whole array.
+
+    * Arguments
+        - kc2: float
+            the smallest value of kc^2 = 1-m, nan is ignored
+
+    * Returns
+        - steps: int
+    """
+    a, g, steps = 1., np.sqrt(kc2), 0
+    while a-g > 1e-15*a and steps < 40:
+        a, g, steps = (a+g)/2, np.sqrt(a*g), steps+1
+    return steps
+
+def _ellipKE(kc2):
+    """
+    To compute the complete elliptic integrals of the first and second kinds
+    together, with one arithmetic-geometric mean iteration
+
+    K = pi/(2 AGM(1,kc)) and E = K (1-sum(2^(n-1) c_n^2)), where c_n are the
+    half differences of the means (c_0^2 = m). The argument is kc^2 = 1-m so
+    that the integrals stay accurate near m = 1, where K diverges. The
+    elements are processed by chunks, each with the number of steps needed
+    by its smallest kc^2.
+
+    * Arguments
+        - kc2: np.array(float)
+            the complementary parameter 1-m, between 0 and 1
+
+    * Returns
+        - K, E: (np.array(float),np.array(float))
+            the complete elliptic integrals of the first and second kinds,
+            with the shape of kc2
+    """
+    kc2 = np.asarray(kc2,dtype=float)
+    K = np.empty(kc2.shape)
+    E = np.empty(kc2.shape)
+    flat, Kf, Ef = kc2.reshape(-1), K.reshape(-1), E.reshape(-1)
+    for i in range(0,flat.size,_ELLIPTIC_CHUNK):
+        chunk = slice(i,i+_ELLIPTIC_CHUNK)
+        g = np.sqrt(flat[chunk])
+        a = np.ones_like(g)
+        c = np.empty_like(g)
+        total = 0.5*(1-flat[chunk])
+        weight = 0.5
+        for _ in range(_agmSteps(np.fmin.reduce(flat[chunk]))):
+            np.subtract(a,g,out=c)
+            c *= 0.5
+            g *= a
+            a -= c
+            np.sqrt(g,out=g)
+            weight *= 2
+            c *= c
+            c *= weight
+            total += c
+        np.divide(np.pi/2,a,out=Kf[chunk])
+        np.subtract(1,total,out=total)
+        np.multiply(Kf[chunk],total,out=Ef[chunk])
+    return K, E
+
+def _ellipKED(kc2,m):
+    """
+    To compute the complete elliptic integrals K and E, with the combinations
+    needed by their derivatives, in one arithmetic-geometric mean iteration
+
+    D = (K-E)/m and G = (K-2D)/m vanish or stay finite at m = 0, and are
+    computed without subtraction from the sums of c_n^2/m^2 (c_(n+1) =
+    c_n^2/(4 a_(n+1)), c_1 = m/(4 a_1)), so that they stay accurate near
+    the axis of a loop as well as near the wire.
+
+    * Arguments
+        - kc2: np.array(float)
+            the complementary parameter 1-m
+        - m: np.array(float)
+            the parameter m, broadcast against kc2
+
+    * Returns
+        - K, E, D, G: (np.array(float),np.array(float),np.array(float),np.array(float))
+            the integrals and the combinations, with the shape of kc2 and m
+    """
+    kc2, m = np.broadcast_arrays(np.asarray(kc2,dtype=float),np.asarray(m,dtype=float))
+    K, E, D, G = (np.empty(kc2.shape) for _ in range(4))
+    flat, mf = kc2.reshape(-1), m.reshape(-1)
+    Kf, Ef, Df, Gf = K.reshape(-1), E.reshape(-1), D.reshape(-1), G.reshape(-1)
+    for i in range(0,flat.size,_ELLIPTIC_CHUNK):
+        chunk = slice(i,i+_ELLIPTIC_CHUNK)
+        mi = mf[chunk]
+        m2 = mi*mi
+        g = np.sqrt(flat[chunk])
+        a = np.ones_like(g)
+        t = np.empty_like(g)
+        # W = c_n^2/m^2 and total = sum(2^(n-1) W) for n >= 1
+        W = np.ones_like(g)
+        total = np.zeros_like(g)
+        weight = 0.5
+        for step in range(_agmSteps(np.fmin.reduce(flat[chunk]))):
+            np.add(a,g,out=t)
+            g *= a
+            np.sqrt(g,out=g)
+            np.multiply(t,0.5,out=a)
+            W *= W
+            if step:
+                W *= m2
+            t *= t
+            t *= 4
+            W /= t
+            weight *= 2
+            np.multiply(W,weight,out=t)
+            total += t
+        np.divide(np.pi/2,a,out=Kf[chunk])
+        np.multiply(Kf[chunk],total,out=Gf[chunk])
+        Gf[chunk] *= -2
+        np.multiply(mi,total,out=t)
+        t += 0.5
+        np.multiply(Kf[chunk],t,out=Df[chunk])
+        np.multiply(mi,Df[chunk],out=t)
+        np.subtract(Kf[chunk],t,out=Ef[chunk])
+    return K, E, D, G
+
+def _fieldRZ(B0,r0,r,z):
+    """
+    To compute the magnetic field of loops in cylindrical coordinates
+
+    Every argument is broadcast against the others, so several loops can be
+    evaluated at once (for example B0 and r0 of shape (N,1) with r and z of
+    shape (N,P)).
+
+    * Arguments
+        - B0: float or np.array(float)
+            magnetic field at the center of the loop
+        - r0: float or np.array(float)
+            the radius of the loop
+        - r: np.array(float)
+            the distance from the axis of the loop
+        - z: np.array(float)
+            the coordinate along the axis, relative to the plane of the loop
+
+    * Returns
+        - Br, Bz: (np.array(float),np.array(float))
+            The radial and axial magnetic field, nan on the loop itself
+    """
+    stats = Stats._active
+    if stats is not None:
+        start = time.perf_counter()
+    a = r/r0
+    b = z/r0
+    Q = (1+a)**2 + b**2
+    # Q-4a and 1-m are written without subtraction to stay accurate near m=1
+    Q4 = (1-a)**2 + b**2
+    onWire = Q4 == 0
+    if np.any(onWire):
+        warnings.warn("Warning : you cannot estimate the field on the loop")
+        Q4 = np.where(onWire,np.nan,Q4)
+    if stats is not None:
+        elliptic = time.perf_counter()
+    K, E = _ellipKE(Q4/Q)
+    if stats is not None:
+        elliptic = time.perf_counter()-elliptic
+    s = B0/(np.pi*np.sqrt(Q))
+    Bz = s*(E*(1-a**2-b**2)/Q4+K)
+    # on the axis, b/a is replaced by 0 since Br vanishes there
+    c = np.divide(b,a,out=np.zeros(np.broadcast(b,a).shape),where=a!=0)
+    Br = s*c*(E*(1+a**2+b**2)/Q4-K)
+    if stats is not None:
+        stats._kernel(np.size(Bz),np.count_nonzero(np.broadcast_to(a == 0,np.shape(Bz))),
+                      np.count_nonzero(Q4 < Stats.NEAR_SINGULAR*Q),np.count_nonzero(onWire),
+                      elliptic,time.perf_counter()-start)
+    return Br, Bz
+
+def _gradientRZ(B0,r0,r,z):
+    """
+    To compute the magnetic field of loops and its derivatives in cylindrical coordinates
+
+    The derivatives of the closed form of _fieldRZ are written with the
+    combinations of the elliptic integrals given by _ellipKED, so that they
+    are computed in the same pass as the field. The other derivatives follow
+    from curl B = 0 (dBr/dz = dBz/dr) and div B = 0 (dBr/dr = -Br/r-dBz/dz).
+    The arguments are broadcast as in _fieldRZ.
+
+    * Arguments
+        - B0: float or np.array(float)
+            magnetic field at the center of the loop
+        - r0: float or np.array(float)
+            the radius of the loop
+        - r: np.array(float)
+            the distance from the axis of the loop
+        - z: np.array(float)
+            the coordinate along the axis, relative to the plane of the loop
+
+    * Returns
+        - Br, Bz, BrOverR, dBzdr, dBzdz: tuple(np.array(float))
+            The radial and axial magnetic field, Br/r (-dBz/dz/2 on the
+            axis) and the derivatives of Bz, nan on the loop itself
+    """
+    stats = Stats._active
+    if stats is not None:
+        start = time.perf_counter()
+    a = r/r0
+    b = z/r0
+    Q = (1+a)**2 + b**2
+    Q4 = (1-a)**2 + b**2
+    onWire = Q4 == 0
+    if np.any(onWire):
+        warnings.warn("Warning : you cannot estimate the field on the loop")
+        Q4 = np.where(onWire,np.nan,Q4)
+    m = 4*a/Q
+    if stats is not None:
+        elliptic = time.perf_counter()
+    K, E, D, G = _ellipKED(Q4/Q,m)
+    if stats is not None:
+        elliptic = time.perf_counter()-elliptic
+    s = B0/(np.pi*np.sqrt(Q))
+    u = 1-a**2-b**2
+    F = E*u/Q4+K
+    Bz = s*F
+    # E(1+a^2+b^2)/Q4-K = 2am(G+D)/Q4, so that Br/r has no division by r
+    BrOverA = 8*s*b*(G+D)/(Q*Q4)
+    Br = a*BrOverA
+    # derivatives of K and E through m = 4a/Q
+    p = 1-a**2+b**2
+    Ka = 2*(K-D)*p/(Q4*Q)
+    Ea = -2*D*p/Q**2
+    Kb = -4*a*b*(K-D)/(Q4*Q)
+    Eb = 4*a*b*D/Q**2
+    Fa = Ea*u/Q4-2*a*E/Q4+2*(1-a)*E*u/Q4**2+Ka
+    Fb = Eb*u/Q4-2*b*E/Q4-2*b*E*u/Q4**2+Kb
+    dBzdr = s*(Fa-(1+a)*F/Q)/r0
+    dBzdz = s*(Fb-b*F/Q)/r0
+    if stats is not None:
+        stats._kernel(np.size(Bz),np.count_nonzero(np.broadcast_to(a == 0,np.shape(Bz))),
+                      np.count_nonzero(Q4 < Stats.NEAR_SINGULAR*Q),np.count_nonzero(onWire),
+                      elliptic,time.perf_counter()-start)
+    return Br, Bz, BrOverA/r0, dBzdr, dBzdz
+
+def _toCartesianGradient(x,y,r,Br,Bz,BrOverR,dBzdr,dBzdz):
+    """
+    To project a field and its derivatives given in cylindrical coordinates
+    on the x, y, z axes
+
+    With dBr/dr = -Br/r-dBz/dz, dBx/dx = Br/r+(dBr/dr-Br/r)cos^2, which
+    gives the right limit -dBz/dz/2 on the axis, where cos = sin = 0.
+
+    * Arguments
+        - x, y: np.array(float)
+            the coordinates relative to the axis
+        - r: np.array(float)
+            the distance from the axis
+        - Br, Bz, BrOverR, dBzdr, dBzdz: np.array(float)
+            the outputs of _gradientRZ
+
+    * Returns
+        - Bx, By, Bz: (np.array(float),np.array(float),np.array(float))
+            The magnetic field
+        - G: np.array(float)
+            the gradient, G[...,i,j] = dB_i/dx_j, shape x.shape+(3,3)
+    """
+    onAxis = r == 0
+    c1 = np.divide(x,r,out=np.zeros(r.shape),where=~onAxis)
+    s1 = np.divide(y,r,out=np.zeros(r.shape),where=~onAxis)
+    difference = -2*BrOverR-dBzdz
+    G = np.empty(r.shape+(3,3))
+    G[...,0,0] = BrOverR+difference*c1**2
+    G[...,0,1] = difference*c1*s1
+    G[...,0,2] = dBzdr*c1
+    G[...,1,0] = G[...,0,1]
+    G[...,1,1] = BrOverR+difference*s1**2
+    G[...,1,2] = dBzdr*s1
+    G[...,2,0] = G[...,0,2]
+    G[...,2,1] = G[...,1,2]
+    G[...,2,2] = dBzdz
+    return Br*c1, Br*s1, Bz+np.zeros(r.shape), G
+
+# approximate size in bytes of the temporaries of _fieldRZ for one (loop, point) pair
+_BYTES_PER_PAIR = 16*8
+
+# with dtype=np.float32, the field is computed in double precision by blocks
+# bounded by maxMemory, and the coordinates, the results and the exported
+# maps are single precision: |B32-B64| <= FLOAT32_ERROR*|B64| away from the
+# wires (checked by benchmarks/bench.py --accuracy)
+FLOAT32_ERROR = 1e-6
+
+def _loopsFieldRZ(B0,r0,z0,r,z,maxMemory=1e8,workers=1,dtype=np.float64,kernel=_fieldRZ,outputs=2):
+    """
+    To compute the sum of the magnetic fields of coaxial loops
+
+    All the (loop, point) pairs are evaluated as broadcast arrays, by blocks
+    small enough for the temporary arrays to stay under maxMemory. With
+    several workers, the blocks of points are spread over a thread pool
+    (numpy releases the GIL) and maxMemory is shared between the workers.
+
+    * Arguments
+        - B0: 1D np.array(float)
+            magnetic field at the center of each loop
+        - r0: 1D np.array(float)
+            the radius of each loop
+        - z0: 1D np.array(float)
+            the position of each loop along the axis
+        - r: np.array(float)
+            the distance from the axis
+        - z: np.array(float)
+            the coordinate along the axis
+        - maxMemory: float
+            maximum memory in bytes used by the temporary arrays
+        - workers: int
+            number of threads
+        - dtype: np.dtype
+            the type of the results, the field is always computed in double
+            precision
+        - kernel: function
+            _fieldRZ, or _gradientRZ to sum the derivatives as well
+        - outputs: int
+            the number of arrays returned by the kernel
+
+    * Returns
+        - Br, Bz: (np.array(float),np.array(float))
+            The radial and axial magnetic field, with the shape of r and z
+            (or the sums of the outputs of the kernel)
+    """
+    B0, r0, z0 = np.broadcast_arrays(np.asarray(B0,dtype=float),
+                                     np.asarray(r0,dtype=float),
+                                     np.asarray(z0,dtype=float))
+    r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+    shape = r.shape
+    r = r.ravel()
+    z = z.ravel()
+    nbLoops = len(z0)
+    workers = max(1,int(workers))
+
+    pairs = max(1,int(maxMemory//(_BYTES_PER_PAIR*outputs//2)//workers))
+    loopStep = max(1,min(nbLoops,pairs))
+    pointStep = max(1,min(pairs//loopStep,-(-len(r)//workers)))
+
+    B = [np.zeros(len(r)) for _ in range(outputs)]
+    def block(i):
+        ri = r[np.newaxis,i:i+pointStep]
+        zi = z[np.newaxis,i:i+pointStep]
+        for j in range(0,nbLoops,loopStep):
+            loops = slice(j,j+loopStep)
+            results = kernel(B0[loops,np.newaxis],r0[loops,np.newaxis],
+                             ri,zi-z0[loops,np.newaxis])
+            for b, result in zip(B,results):
+                b[i:i+pointStep] += result.sum(axis=0)
+    _map(block,range(0,len(r),pointStep),workers)
+    return tuple(b.astype(dtype,copy=False).reshape(shape) for b in B)
+
+def _map(func,items,workers=1):
+    """
+    To apply a function to some items, in a thread pool if workers > 1
+
+    * Arguments
+        - func: function
+            the function to apply
+        - items: iterable
+            the arguments of each call
+        - workers: int
+            number of threads
+
+    * Returns
+        - results: list
+            the results, in the order of the items
+    """
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(func,items))
+
+def _inParallel(func,workers,*coordinates):
+    """
+    To evaluate a field function on chunks of points spread over a thread pool
+
+    * Arguments
+        - func: function
+            func(*coordinates) returns the components of the field
+        - workers: int
+            number of threads
+        - coordinates: np.array(float)
+            the coordinates of the points
+
+    * Returns
+        - B: tuple(np.array(float))
+            the components of the field, with the broadcast shape of the
+            coordinates, reassembled in the order of the points
+    """
+    coordinates = np.broadcast_arrays(*[np.asarray(c,dtype=float) for c in coordinates])
+    shape = coordinates[0].shape
+    if workers <= 1 or coordinates[0].size < 2:
+        return func(*coordinates)
+    chunks = zip(*[np.array_split(c.ravel(),workers) for c in coordinates])
+    results = _map(lambda c: func(*c),chunks,workers)
+    return tuple(np.concatenate(B).reshape(shape) for B in zip(*results))
+
+def _toCartesian(x,y,r,Br,Bz):
+    """
+    To project a field given in cylindrical coordinates on the x, y, z axes
+
+    * Arguments
+        - x, y: np.array(float)
+            the coordinates relative to the axis
+        - r: np.array(float)
+            the distance from the axis
+        - Br, Bz: np.array(float)
+            the radial and axial magnetic field
+
+    * Returns
+        - Bx, By, Bz: (np.array(float),np.array(float),np.array(float))
+            The magnetic field
+    """
+    onAxis = r == 0
+    c1 = np.divide(x,r,out=np.zeros(r.shape,dtype=r.dtype),where=~onAxis)
+    s1 = np.divide(y,r,out=np.zeros(r.shape,dtype=r.dtype),where=~onAxis)
+    return Br*c1, Br*s1, Bz+np.zeros(r.shape,dtype=r.dtype)
+
+def _turnArrays(source):
+    """
+    To get the turns of a Loop or a Solenoid as arrays
+
+    * Arguments
+        - source: Loop or Solenoid
+            the object
+
+    * Returns
+        - B0, r0, z0: (1D np.array(float),1D np.array(float),1D np.array(float))
+            the magnetic field at the center, the radius and the z position
+            of each turn
+    """
+    if hasattr(source,"strengths"):
+        return source.strengths, source.radii, source.centers[:,2]
+    return (np.array([source.B0],dtype=float),np.array([source.r0],dtype=float),
+            np.array([source.z0],dtype=float))
 
 class Loop:
     """
@@ -26,6 +467,9 @@ class Loop:
             the z position of the loop
         - self.r0: float
             the radius of the loop
+        - self.cache: FieldCache
+            the cache of the computed fields (see Solenoyds.Cache),
+            None to compute them at each call
     """
     def __init__(self,B0=1,x0=0,y0=0,z0=0,r0=1):
         """
@@ -50,11 +494,12 @@ class Loop:
         self.y0 = y0
         self.z0 = z0
         self.r0 = r0
+        self.cache = None
 
     def __str__(self):
         return "B0 = "+str(self.B0)+", x0 = "+str(self.x0)+", y0 = "+str(self.y0)+", z0 = "+str(self.z0)+", r0 = "+str(self.r0)
 
-    def field(self,x,y,z):
+    def field(self,x,y,z,workers=1,dtype=np.float64):
         """
         To compute the magnetic field produced by the loop
         
@@ -65,6 +510,11 @@ class Loop:
                 the y coordinate
             - z: float
                 the y coordinate
+            - workers: int
+                number of threads sharing the points
+            - dtype: np.dtype
+                np.float64, or np.float32 to return the field in single
+                precision (see FLOAT32_ERROR)
         
         * Returns
             - Bx, By, Bz: (float,float,float)
@@ -76,45 +526,92 @@ class Loop:
             x, y, z = np.meshgrid(l,l,l)
             Bx, By, Bz = loop.field(x, y, z)
         """
-        x = x-self.x0
-        y = y-self.y0
-        z = z-self.z0
+        if self.cache is not None:
+            return self.cache.field(self,lambda x,y,z: self._field(x,y,z,workers,dtype),x,y,z,dtype)
+        return self._field(x,y,z,workers,dtype)
+
+    def _field(self,x,y,z,workers=1,dtype=np.float64):
+        """
+        To compute the magnetic field produced by the loop, without the cache
+        """
+        if workers > 1:
+            return _inParallel(lambda x,y,z: self._field(x,y,z,1,dtype),workers,x,y,z)
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float)-self.z0)
+        if Stats._active is not None:
+            Stats._active._call(x.size,1)
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = _fieldRZ(self.B0,self.r0,r,z)
+        return _toCartesian(*[v.astype(dtype,copy=False) for v in (x,y,r,Br,Bz)])
+
+    def field_rz(self,r,z,dtype=np.float64):
+        """
+        To compute the magnetic field produced by the loop in cylindrical coordinates
+        
+        * Arguments
+            - r: float
+                the distance from the axis of the loop
+            - z: float
+                the z coordinate
+            - dtype: np.dtype
+                np.float64, or np.float32 to return the field in single precision
+        
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field
         
-        def f(x1,y1,z1):
-            K = special.ellipk
-            E = special.ellipe
-            r = np.sqrt(x1**2+y1**2)
-            a = r/self.r0
-            b = z1/self.r0
-            
-            Q = (1+a)**2 + b**2
-            m = 4*a/Q
-            
-            if r == self.r0 and z1 == 0:
-                warnings.warn("Warning : you cannot estimate the field on the loop")
-                return np.nan, np.nan, np.nan
-            if r == 0:
-                ca = self.r0/np.sqrt(self.r0**2+z1**2)
-                Bz = self.B0*(ca**3)                
-                return 0, 0, Bz
-            
-            if np.abs(m-1) < 0.01:
-                def K(x):
-                    return special.ellipkm1(1-x)
-            
-            c1 = x1/r
-            s1 = y1/r
-            c = z1/r
-            Bz = self.B0/(np.pi*np.sqrt(Q))*(E(m)*(1-a**2-b**2)/(Q-4*a)+K(m))
-            Br = self.B0*c/(np.pi*np.sqrt(Q))*(E(m)*(1+a**2+b**2)/(Q-4*a)-K(m))
-            Bx = Br*c1
-            By = Br*s1
-            return Bx, By, Bz
-        vect = np.vectorize(f)
-        return vect(x,y,z)
-
-
-    def displayLoop(self,figsize=(10,10),color="red",linewidth=3):
+        * Example
+            loop = Loop(1,1,2,3,5)
+            r, z = np.meshgrid(np.linspace(0,10,50),np.linspace(-2,8,50))
+            Br, Bz = loop.field_rz(r, z)
+        """
+        r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+        if Stats._active is not None:
+            Stats._active._call(r.size,1)
+        Br, Bz = _fieldRZ(self.B0,self.r0,r,z-self.z0)
+        return (Br+np.zeros(r.shape)).astype(dtype,copy=False), Bz.astype(dtype,copy=False)
+
+    def field_and_gradient(self,x,y,z,workers=1):
+        """
+        To compute the magnetic field produced by the loop and its gradient
+
+        The derivatives are analytic, computed in the same pass as the field
+        from the same elliptic integrals.
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+            - workers: int
+                number of threads sharing the points
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field
+            - G: np.array(float)
+                the gradient of the field, G[...,i,j] = dB_i/dx_j, of shape
+                x.shape+(3,3)
+
+        * Example
+            loop = Loop(1,1,2,3,5)
+            Bx, By, Bz, G = loop.field_and_gradient(1,2,4)
+            dBzdz = G[2,2]
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float)-self.z0)
+        if Stats._active is not None:
+            Stats._active._call(x.size,1)
+        r = np.sqrt(x**2+y**2)
+        gradient = lambda r,z: _gradientRZ(self.B0,self.r0,r,z)
+        return _toCartesianGradient(x,y,r,*_inParallel(gradient,workers,r,z))
+
+
+    def displayLoop(self,figsize=(10,10),color="red",linewidth=3,fig=None):
         """
         To display the loop
         
@@ -125,6 +622,8 @@ class Loop:
                 color of the loop
             - linewidth: float
                 thickness of the loop
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
         * Returns
             - fig: matplotlib.pyplot.figure
                 the figure
@@ -134,24 +633,10 @@ class Loop:
             fig = loop.displayLoop()
             fig.savefig("loop.png")
         """
-        t = np.linspace(0,2*np.pi,100)
-        xs = self.x0 + self.r0*np.cos(t)
-        ys = self.y0 + self.r0*np.sin(t)
-        zs = self.z0*np.ones(len(t))
-        
-        title = r"$B_0 = "+str(self.B0)+"T, x_0 = "+str(self.x0)+", y_0 = "+str(self.y0)+", z_0 = "+str(self.z0)+", r_0 = $"+str(self.r0)
-        
-        fig = plt.figure(figsize=figsize)
-        ax = fig.gca(projection='3d')
-        ax.plot(xs,ys,zs,color=color,linewidth=linewidth)
-        ax.set_xlabel(r"x",fontsize=15)
-        ax.set_ylabel(r"y",fontsize=15)
-        ax.set_zlabel(r"z",fontsize=15)
-        ax.set_title(title,fontsize=15)
-        
-        return fig
+        from Solenoyds import Plot
+        return Plot.displayLoop(self,figsize,color,linewidth,fig)
     
-    def displayField3D(self,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=3):
+    def displayField3D(self,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=3,fig=None):
         """
         To display the field
         * Arguments
@@ -165,6 +650,8 @@ class Loop:
                 color of the arrows
             - linewidth: float
                 thickness of the loop
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
                 
         * Returns
             - fig: matplotlib.pyplot.figure
@@ -174,33 +661,10 @@ class Loop:
             fig = loop.displayField3D()
             fig.savefig("3D.png")
         """
-        x, y, z = np.meshgrid(np.linspace(-2*self.r0+self.x0, 2*self.r0+self.x0, nb_points),
-                               np.linspace(-2*self.r0+self.y0, 2*self.r0+self.y0, nb_points),
-                               np.linspace(-2*self.r0+self.z0, 2*self.r0+self.z0, nb_points))
-        x = np.concatenate(np.concatenate(x))
-        y = np.concatenate(np.concatenate(y))
-        z = np.concatenate(np.concatenate(z))
-        Bx, By, Bz = self.field(x,y,z)
-        
-        t = np.linspace(0,2*np.pi,100)
-        xs = self.x0 + self.r0*np.cos(t)
-        ys = self.y0 + self.r0*np.sin(t)
-        zs = self.z0*np.ones(len(t))
-        
-        title = r"$B_0 = "+str(self.B0)+"T, x_0 = "+str(self.x0)+", y_0 = "+str(self.y0)+", z_0 = "+str(self.z0)+", r_0 = $"+str(self.r0)
+        from Solenoyds import Plot
+        return Plot.displayLoopField3D(self,figsize,nb_points,colorLoop,colorArrow,linewidth,fig)
         
-        fig = plt.figure(figsize=figsize)
-        ax = fig.gca(projection='3d')
-        ax.set_xlabel(r"x",fontsize=15)
-        ax.set_ylabel(r"y",fontsize=15)
-        ax.set_zlabel(r"z",fontsize=15)
-        ax.set_title(title,fontsize=15)
-        ax.quiver(x, y, z, Bx, By, Bz, length=self.r0*0.2, normalize=True, color = colorArrow)
-        ax.plot(xs,ys,zs,color=colorLoop,linewidth=linewidth)
-
-        return fig
-        
-    def displayField2D(self,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True):
+    def displayField2D(self,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True,fig=None):
         """
         To display the field in a plan x=0, y=0 or z=0
 
@@ -216,6 +680,8 @@ class Loop:
                 color of the arrows
             - markLoop: boolean
                 To diplay the position of the loop
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
         * Returns
             - fig: matplotlib.pyplot.figure
                 the figure
@@ -225,52 +691,12 @@ class Loop:
             fig = loop.displayField2D()
             fig.savefig("2D.png")
         """
-        nb_points = int(nb_points)
-        fig = plt.figure(figsize=figsize)
-
-
-        if eq_0 == "x":
-            x1, x2 = np.meshgrid(np.linspace(-2*self.r0+self.y0, 2*self.r0+self.y0, nb_points),np.linspace(-2*self.r0+self.z0, 2*self.r0+self.z0, nb_points))
-            x3 = np.zeros_like(x1)+self.x0
-            Bx3, Bx1, Bx2 = self.field(x3, x1, x2)
-            dotx1 = np.array([-self.r0,self.r0])+self.y0
-            dotx2 = [self.z0,self.z0]
-            xlabel = r"$y$"
-            ylabel = r"$z$"
-            title = r"x = "+str(self.x0)
-
-        elif eq_0 == "y":
-            x1, x2 = np.meshgrid(np.linspace(-2*self.r0+self.x0, 2*self.r0+self.x0, nb_points),np.linspace(-2*self.r0+self.z0, 2*self.r0+self.z0, nb_points))
-            x3 = np.zeros_like(x1)+self.y0
-            Bx1, Bx3, Bx2 = self.field(x1, x3, x2)
-            dotx1 = np.array([-self.r0,self.r0])+self.x0
-            dotx2 = [self.z0,self.z0]
-            xlabel = r"$x$"
-            ylabel = r"$z$"
-            title = r"y = "+str(self.y0)
-
-        else:
-            print("Your choice of plan is incorrect")
-            return fig        
-
-        no = np.sqrt(Bx1**2+Bx2**2+Bx3**2)
-        Bx1 = Bx1/no
-        Bx2 = Bx2/no
-        
-        plt.title(r"$B_0 = $"+str(self.B0)+"$T$, "+title,fontsize=15)
-        plt.xlabel(xlabel,fontsize=15)
-        plt.ylabel(ylabel,fontsize=15)
-        plt.quiver(x1,x2,Bx1,Bx2,color=color)
-        
-        if markLoop:
-            plt.plot(dotx1,dotx2,'.',ms=15,color="red")
-        plt.tight_layout()
-
-        return fig
+        from Solenoyds import Plot
+        return Plot.displayLoopField2D(self,eq_0,figsize,nb_points,color,markLoop,fig)
 
-    def exportFieldMap(self,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points):
+    def exportFieldMap(self,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,workers=1,format=None,precision=None,slabSize=2**20,progress=None,dtype=np.float64):
         """
-        To export a field map as a .txt file
+        To export a field map as a .txt, .npy, .npz or .fmap file
         
         * Arguments
             - filename: String
@@ -289,26 +715,74 @@ class Loop:
                 the z max coordinate
             - nb_points: int
                 number of points of evaluation on each axis
+            - workers: int
+                number of threads used to compute the field
+            - format: String
+                "txt", "npy", "npz" or "raw", None to use the extension
+                of filename (see Solenoyds.Export)
+            - precision: int
+                number of significant digits in the text format,
+                None for the shortest representation giving back the same float
+            - slabSize: int
+                number of points computed and written at once, the memory
+                used only depends on it
+            - progress: function
+                progress(done,total) is called after each slab with the
+                number of points written and the total number of points
+            - dtype: np.dtype
+                np.float64, or np.float32 to write the map in single
+                precision (see FLOAT32_ERROR)
         * Example
             loop = Loop()
             loop.exportFieldMap("output_map.txt",-1,1,-1,1,-1,1,20)
+            loop.exportFieldMap("output_map.fmap",-1,1,-1,1,-1,1,20)
         """
         
-        x, y, z = np.meshgrid(np.linspace(xmin,xmax,nb_points),
-                              np.linspace(ymin,ymax,nb_points),
-                              np.linspace(zmin,zmax,nb_points))
-        x = np.concatenate(np.concatenate(x))
-        y = np.concatenate(np.concatenate(y))
-        z = np.concatenate(np.concatenate(z))
-        Bx, By, Bz = self.field(x,y,z)
+        field = lambda x,y,z: self._field(x,y,z,workers=workers,dtype=dtype)
+        if self.cache is not None:
+            self.cache.exportFieldMap(self,field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format,precision,slabSize,progress,dtype)
+            return
+        writeFieldMap(field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format,precision,slabSize,progress,dtype)
+
+    def fieldMapSlabs(self,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize=2**20,workers=1,dtype=np.float64):
+        """
+        To compute a field map slab by slab, in the order of exportFieldMap
         
-        with open(filename,'w') as f:
-            for i in np.arange(len(x)):
-                f.write(str(x[i])+';'+str(y[i])+';'+str(z[i])+';'+str(Bx[i])+';'+str(By[i])+';'+str(Bz[i])+'\n')
+        * Arguments
+            - xmin: float
+                the x min coordinate
+            - xmax: float
+                the x max coordinate
+            - ymin: float
+                the y min coordinate
+            - ymax: float
+                the y max coordinate
+            - zmin: float
+                the z min coordinate
+            - zmax: float
+                the z max coordinate
+            - nb_points: int
+                number of points of evaluation on each axis
+            - slabSize: int
+                number of points in each slab
+            - workers: int
+                number of threads used to compute the field
+            - dtype: np.dtype
+                the precision of the field
+        * Yields
+            - x, y, z, Bx, By, Bz: 1D np.array(float)
+                the coordinates and the magnetic field of the points of a slab
+        * Example
+            loop = Loop()
+            for x, y, z, Bx, By, Bz in loop.fieldMapSlabs(-1,1,-1,1,-1,1,100):
+                print(np.max(np.abs(Bz)))
+        """
+        field = lambda x,y,z: self.field(x,y,z,workers=workers,dtype=dtype)
+        return fieldMapSlabs(field,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize)
 
-    def exportField(self,filename,x,y,z):
+    def exportField(self,filename,x,y,z,workers=1,format=None,precision=None,dtype=np.float64):
         """
-        To export the field computed in some points as a .txt file
+        To export the field computed in some points as a .txt, .npy, .npz or .fmap file
         
         * Arguments
             - filename: String
@@ -319,6 +793,17 @@ class Loop:
                 the y coordinates
             - z: 1D np.array(float)
                 the z coordinates
+            - workers: int
+                number of threads used to compute the field
+            - format: String
+                "txt", "npy", "npz" or "raw", None to use the extension
+                of filename (see Solenoyds.Export)
+            - precision: int
+                number of significant digits in the text format,
+                None for the shortest representation giving back the same float
+            - dtype: np.dtype
+                np.float64, or np.float32 to write the field in single
+                precision (see FLOAT32_ERROR)
         * Example
             z = np.linspace(-2,2,20)
             x = np.zeros_like(z)
@@ -327,11 +812,8 @@ class Loop:
             loop.exportField("output.txt",x,y,z)
         """
         
-        Bx, By, Bz = self.field(x,y,z)
-        
-        with open(filename,'w') as f:
-            for i in np.arange(len(x)):
-                f.write(str(x[i])+';'+str(y[i])+';'+str(z[i])+';'+str(Bx[i])+';'+str(By[i])+';'+str(Bz[i])+'\n')
+        Bx, By, Bz = self.field(x,y,z,workers=workers,dtype=dtype)
+        writeField(filename,x,y,z,Bx,By,Bz,None,format,precision,dtype)
                 
     def plotFieldMainAxis(self,zmin,zmax,nbpoints=100,figsize=(8,5)):
         """
@@ -356,24 +838,5 @@ class Loop:
             fig = loop.plotFieldMainAxis(zmin=-5,zmax=5)
             fig.savefig("axis_loop.png")
         """
-        
-        nbpoints = int(nbpoints)
-        z = np.linspace(zmin,zmax,nbpoints)+self.z0
-        x = np.zeros_like(z)+self.x0
-        y = np.zeros_like(z)+self.y0
-        
-        Bx, By, Bz = self.field(x,y,z)
-
-        fig = plt.figure(figsize=figsize)
-
-        plt.plot(z,Bz)
-        plt.xlabel(r"$z$ $(m)$",fontsize=15)
-        plt.ylabel(r"$B_z$ $(T)$",fontsize=15)
-        plt.title("Magnetic field on the main axis",fontsize=15)
-        plt.axis([min(z),max(z),min(Bz),max(Bz)*1.1])
-        plt.grid()
-
-        
-        plt.tight_layout()
-        
-        return fig
\ No newline at end of file
+        from Solenoyds import Plot
+        return Plot.plotFieldMainAxis(self,zmin,zmax,nbpoints,figsize)
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+from scipy import special
+from Solenoyds.Loop import _loopsFieldRZ, _toCartesian, _turnArrays
+
+class _Group:
+    """
+    A group of contiguous loops and its multipole expansion
+
+    * Attributes
+        - self.start, self.stop: int
+            the loops of the group are loops[start:stop]
+        - self.zc: float
+            the center of the expansion on the axis
+        - self.radius: float
+            the radius of the smallest sphere centered on zc holding the loops
+        - self.A: 1D np.array(float)
+            the coefficients A_1 ... A_order of the expansion
+        - self.children: list(_Group)
+            the two halves of the group, empty for a leaf
+    """
+    def __init__(self,B0,r0,z0,start,stop,order,leafSize):
+        self.start = start
+        self.stop = stop
+        self.zc = (z0[start]+z0[stop-1])/2
+        a = r0[start:stop]
+        h = z0[start:stop]-self.zc
+        rho = np.sqrt(a**2+h**2)
+        self.radius = np.max(rho)
+        # on the axis, the field of a loop beyond rho is
+        # B0 a^3 sum_n C_n^(3/2)(h/rho) rho^n / z^(n+3)
+        # which gives the coefficient A_(n+1) of the scalar potential
+        n = np.arange(order)[:,np.newaxis]
+        C = special.eval_gegenbauer(n,1.5,h/rho)
+        self.A = np.sum(B0[start:stop]*a**3*C*rho**n,axis=1)/(n[:,0]+2)
+        self.children = []
+        if stop-start > leafSize:
+            middle = (start+stop)//2
+            self.children = [_Group(B0,r0,z0,start,middle,order,leafSize),
+                             _Group(B0,r0,z0,middle,stop,order,leafSize)]
+
+    def field_rz(self,r,dz):
+        """
+        To compute the field of the group from its multipole expansion,
+        valid for sqrt(r**2+dz**2) > self.radius
+        """
+        R = np.sqrt(r**2+dz**2)
+        c = dz/R
+        s = r/R
+        BR = 0
+        Btheta = 0
+        P0, P1 = np.ones_like(c), c
+        dP0, dP1 = np.zeros_like(c), np.ones_like(c)
+        Rl = R**3
+        for l in range(1,len(self.A)+1):
+            BR = BR+(l+1)*self.A[l-1]*P1/Rl
+            Btheta = Btheta+self.A[l-1]*s*dP1/Rl
+            P0, P1 = P1, ((2*l+1)*c*P1-l*P0)/(l+1)
+            dP0, dP1 = dP1, dP0+(2*l+1)*P0
+            Rl = Rl*R
+        return BR*s+Btheta*c, BR*c-Btheta*s
+
+class MultipoleTree:
+    """
+    To compute the field of many coaxial loops with a hierarchical multipole expansion
+
+    The loops are grouped in a binary tree of contiguous turns. For each
+    point, a group is replaced by its multipole expansion when the point is
+    well separated from it (radius/R <= theta), otherwise its two halves are
+    examined, down to leaves whose loops are summed exactly.
+
+    * Attributes
+        - self.x0: float
+            the x position of the axis
+        - self.y0: float
+            the y position of the axis
+        - self.tol: float
+            the relative truncation error accepted for each group
+        - self.order: int
+            the number of terms of the expansions
+        - self.theta: float
+            the largest ratio radius/R for which an expansion is used
+        - self.root: _Group
+            the group of all the loops
+    """
+    def __init__(self,source,tol=1e-6,order=12,leafSize=32):
+        """
+        The constructor
+
+        * Arguments
+            - source: Loop or Solenoid
+                the loops, a Solenoid must use the "loops" model
+            - tol: float
+                the relative truncation error accepted for each group
+            - order: int
+                the number of terms of the expansions
+            - leafSize: int
+                the largest number of loops summed exactly in a leaf
+
+        * Example
+            sol = Solenoid(n=2000)
+            tree = MultipoleTree(sol,tol=1e-8)
+            Bx, By, Bz = tree.field(3,4,5)
+        """
+        if getattr(source,"model","loops") != "loops":
+            raise ValueError("the multipole expansion needs the \"loops\" model")
+        B0, r0, z0 = _turnArrays(source)
+        self.x0 = source.x0
+        self.y0 = source.y0
+        self.tol = tol
+        self.order = int(order)
+        self.theta = tol**(1/(self.order+1))
+
+        sort = np.argsort(z0,kind="stable")
+        self._B0 = B0[sort]
+        self._r0 = r0[sort]
+        self._z0 = z0[sort]
+        self.root = _Group(self._B0,self._r0,self._z0,0,len(z0),self.order,max(1,int(leafSize)))
+
+    def __str__(self):
+        return "tol = "+str(self.tol)+", order = "+str(self.order)+", theta = "+str(self.theta)+", N = "+str(len(self._z0))
+
+    def field_rz(self,r,z):
+        """
+        To compute the magnetic field in cylindrical coordinates
+
+        * Arguments
+            - r: float
+                the distance from the axis
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field
+        """
+        r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+        shape = r.shape
+        r = r.ravel()
+        z = z.ravel()
+        Br = np.zeros(len(r))
+        Bz = np.zeros(len(r))
+        stack = [(self.root,np.arange(len(r)))]
+        while stack:
+            group, index = stack.pop()
+            if len(index) == 0:
+                continue
+            if not group.children:
+                loops = slice(group.start,group.stop)
+                br, bz = _loopsFieldRZ(self._B0[loops],self._r0[loops],self._z0[loops],r[index],z[index])
+                Br[index] += br
+                Bz[index] += bz
+                continue
+            dz = z[index]-group.zc
+            far = group.radius <= self.theta*np.sqrt(r[index]**2+dz**2)
+            if np.any(far):
+                br, bz = group.field_rz(r[index[far]],dz[far])
+                Br[index[far]] += br
+                Bz[index[far]] += bz
+            near = index[~far]
+            stack.extend((child,near) for child in group.children)
+        return Br.reshape(shape), Bz.reshape(shape)
+
+    def field(self,x,y,z):
+        """
+        To compute the magnetic field
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field
+
+        * Example
+            sol = Solenoid(n=2000)
+            tree = MultipoleTree(sol)
+            l = np.linspace(-10,10,50)
+            x, y, z = np.meshgrid(l,l,l)
+            Bx, By, Bz = tree.field(x, y, z)
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float))
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = self.field_rz(r,z)
+        return _toCartesian(x,y,r,Br,Bz)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+from math import factorial
+from scipy import special
+from scipy.interpolate import CubicSpline
+from Solenoyds.Loop import _toCartesian, _turnArrays
+
+def _axisDerivatives(a,zeta,order):
+    """
+    To compute the derivatives of (a**2+zeta**2)**(-3/2) with respect to zeta
+
+    From the generating function of the Gegenbauer polynomials, the n-th
+    derivative is n! rho**(-3-n) C_n^(3/2)(-zeta/rho) with rho**2 = a**2+zeta**2.
+
+    * Arguments
+        - a: np.array(float)
+            the radius of the loops
+        - zeta: np.array(float)
+            the distance to the loops along the axis
+        - order: int
+            the highest derivative
+
+    * Returns
+        - D: list(np.array(float))
+            the derivatives 0 to order
+    """
+    rho = np.sqrt(a**2+zeta**2)
+    return [factorial(n)*rho**(-3-n)*special.eval_gegenbauer(n,1.5,-zeta/rho) for n in range(order+1)]
+
+class Paraxial:
+    """
+    To compute the field near the axis from the paraxial power expansion
+
+    The on-axis field Bz(z) and its z-derivatives are computed once,
+    analytically, on a grid of z and interpolated with cubic splines. Off the
+    axis:
+        Bz(r,z) = sum_k (-1)^k/(k!)^2 (r/2)^(2k) Bz^(2k)(z)
+        Br(r,z) = sum_k (-1)^(k+1)/(k!(k+1)!) (r/2)^(2k+1) Bz^(2k+1)(z)
+    with all the derivatives up to order.
+
+    * Attributes
+        - self.x0: float
+            the x position of the axis
+        - self.y0: float
+            the y position of the axis
+        - self.zmin: float
+            the z min coordinate
+        - self.zmax: float
+            the z max coordinate
+        - self.order: int
+            the highest derivative of Bz used
+        - self.tol: float
+            the relative error accepted for the truncation
+        - self.convergence: float
+            the radius of convergence of the expansion, the smallest distance
+            from the axis to the singularities of the loops
+        - self.radius: float
+            the radius of validity, below which the first neglected term is
+            smaller than tol
+        - self.spline: scipy.interpolate.CubicSpline
+            the derivatives of Bz on the axis as functions of z
+    """
+    def __init__(self,source,zmin,zmax,nb_points=1000,order=6,tol=1e-6):
+        """
+        The constructor
+
+        * Arguments
+            - source: Loop or Solenoid
+                the object whose field is expanded
+            - zmin: float
+                the z min coordinate
+            - zmax: float
+                the z max coordinate
+            - nb_points: int
+                number of points of the grid of z
+            - order: int
+                the highest derivative of Bz used
+            - tol: float
+                the relative error accepted for the truncation, which gives
+                the radius of validity
+
+        * Example
+            sol = Solenoid(n=1000,L=2)
+            par = Paraxial(sol,-2,2,order=8)
+            print(par.radius)
+            Bx, By, Bz = par.field(0.01,0.02,0.5)
+        """
+        self.x0 = source.x0
+        self.y0 = source.y0
+        self.zmin = zmin
+        self.zmax = zmax
+        self.order = int(order)
+        self.tol = tol
+        z = np.linspace(zmin,zmax,int(nb_points))
+
+        if getattr(source,"model","loops") == "sheet":
+            # Bz = B0/2 (g(z-z0+L/2)-g(z-z0-L/2)) with g(u) = u/sqrt(u**2+r0**2),
+            # whose derivatives are r0**2 times the ones of (u**2+r0**2)**(-3/2)
+            a = source.r0
+            D = np.zeros((self.order+1,len(z)))
+            for sign, u in ((1,z-source.z0+source.L/2),(-1,z-source.z0-source.L/2)):
+                D[0] += sign*u/np.sqrt(u**2+a**2)
+                if self.order > 0:
+                    D[1:] += sign*a**2*np.array(_axisDerivatives(a,u,self.order-1))
+            D *= source.B0/2
+            self.convergence = a
+        else:
+            B0, r0, z0 = _turnArrays(source)
+            D = np.zeros((self.order+1,len(z)))
+            step = max(1,2**20//len(z0))
+            for i in range(0,len(z),step):
+                zeta = z[np.newaxis,i:i+step]-z0[:,np.newaxis]
+                for n, d in enumerate(_axisDerivatives(r0[:,np.newaxis],zeta,self.order)):
+                    D[n,i:i+step] = np.sum((B0*r0**3)[:,np.newaxis]*d,axis=0)
+            self.convergence = np.min(r0)
+
+        self.spline = CubicSpline(z,D,axis=1)
+        self.radius = self.convergence*tol**(1/(self.order+1))
+
+    def __str__(self):
+        return "zmin = "+str(self.zmin)+", zmax = "+str(self.zmax)+", order = "+str(self.order)+", radius = "+str(self.radius)
+
+    def field_rz(self,r,z):
+        """
+        To compute the magnetic field in cylindrical coordinates
+
+        * Arguments
+            - r: float
+                the distance from the axis, should be smaller than self.radius
+            - z: float
+                the z coordinate, between zmin and zmax
+
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field
+        """
+        r, z = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float))
+        D = self.spline(z)
+        h = r/2
+        Br = np.zeros(r.shape)
+        Bz = np.zeros(r.shape)
+        for n in range(self.order+1):
+            k = n//2
+            if n % 2 == 0:
+                Bz += (-1)**k/factorial(k)**2*h**n*D[n]
+            else:
+                Br += (-1)**(k+1)/(factorial(k)*factorial(k+1))*h**n*D[n]
+        return Br, Bz
+
+    def field(self,x,y,z):
+        """
+        To compute the magnetic field
+
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field
+
+        * Example
+            sol = Solenoid(n=1000,L=2)
+            par = Paraxial(sol,-2,2)
+            z = np.linspace(-2,2,1000)
+            Bx, By, Bz = par.field(0.01,0,z)
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float))
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = self.field_rz(r,z)
+        return _toCartesian(x,y,r,Br,Bz)
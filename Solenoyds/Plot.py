@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+import matplotlib.pyplot as plt
+
+def _figure(fig,figsize,projection=None):
+    """
+    To get a figure and its axes, a new one or a reused one which is cleared
+
+    * Arguments
+        - fig: matplotlib.figure.Figure or None
+            the figure to reuse, None for a new pyplot figure
+        - figsize: (float,float)
+            the size of the figure
+        - projection: string
+            the projection of the axes, "3d" or None
+
+    * Returns
+        - fig: matplotlib.figure.Figure
+            the figure
+        - ax: matplotlib.axes.Axes
+            the axes
+    """
+    if fig is None:
+        fig = plt.figure(figsize=figsize)
+    else:
+        fig.clf()
+        fig.set_size_inches(figsize)
+    return fig, fig.add_subplot(projection=projection)
+
+def _displayedTurns(N,maxLoops):
+    """
+    To choose the turns to display, evenly spaced and with both ends
+
+    * Arguments
+        - N: int
+            number of turns
+        - maxLoops: int or None
+            largest number of turns displayed, None for all of them
+
+    * Returns
+        - indices: 1D np.array(int)
+            the indices of the displayed turns
+    """
+    if maxLoops is None or N <= maxLoops:
+        return np.arange(N)
+    return np.unique(np.linspace(0,N-1,max(2,int(maxLoops))).round().astype(int))
+
+def _drawCircles(ax,centers,radii,color,linewidth,nb_points=100):
+    """
+    To draw circles of axis z in 3D axes as one collection
+
+    * Arguments
+        - ax: mpl_toolkits.mplot3d.Axes3D
+            the axes
+        - centers: 2D np.array(float)
+            the centers of the circles, shape (M,3)
+        - radii: 1D np.array(float)
+            the radii of the circles
+        - color: string
+            color of the circles
+        - linewidth: float
+            thickness of the circles
+        - nb_points: int
+            number of points of each circle
+    """
+    t = np.linspace(0,2*np.pi,nb_points)
+    lines = np.empty((len(radii),nb_points,3))
+    lines[:,:,0] = centers[:,0,np.newaxis]+radii[:,np.newaxis]*np.cos(t)
+    lines[:,:,1] = centers[:,1,np.newaxis]+radii[:,np.newaxis]*np.sin(t)
+    lines[:,:,2] = centers[:,2,np.newaxis]
+    ax.add_collection3d(Line3DCollection(lines,colors=color,linewidths=linewidth))
+    if len(lines):
+        low = lines.min(axis=(0,1))
+        high = lines.max(axis=(0,1))
+        ax.auto_scale_xyz([low[0],high[0]],[low[1],high[1]],[low[2],high[2]],had_data=ax.has_data())
+
+def displayLoop(loop,figsize=(10,10),color="red",linewidth=3,fig=None):
+    """
+    To display a loop, see Loop.displayLoop
+    """
+    t = np.linspace(0,2*np.pi,100)
+    xs = loop.x0 + loop.r0*np.cos(t)
+    ys = loop.y0 + loop.r0*np.sin(t)
+    zs = loop.z0*np.ones(len(t))
+
+    title = r"$B_0 = "+str(loop.B0)+"T, x_0 = "+str(loop.x0)+", y_0 = "+str(loop.y0)+", z_0 = "+str(loop.z0)+", r_0 = $"+str(loop.r0)
+
+    fig, ax = _figure(fig,figsize,"3d")
+    ax.plot(xs,ys,zs,color=color,linewidth=linewidth)
+    ax.set_xlabel(r"x",fontsize=15)
+    ax.set_ylabel(r"y",fontsize=15)
+    ax.set_zlabel(r"z",fontsize=15)
+    ax.set_title(title,fontsize=15)
+
+    return fig
+
+def displayLoopField3D(loop,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=3,fig=None):
+    """
+    To display the field of a loop in 3D, see Loop.displayField3D
+    """
+    x, y, z = np.meshgrid(np.linspace(-2*loop.r0+loop.x0, 2*loop.r0+loop.x0, nb_points),
+                           np.linspace(-2*loop.r0+loop.y0, 2*loop.r0+loop.y0, nb_points),
+                           np.linspace(-2*loop.r0+loop.z0, 2*loop.r0+loop.z0, nb_points))
+    x = np.concatenate(np.concatenate(x))
+    y = np.concatenate(np.concatenate(y))
+    z = np.concatenate(np.concatenate(z))
+    Bx, By, Bz = loop.field(x,y,z)
+
+    t = np.linspace(0,2*np.pi,100)
+    xs = loop.x0 + loop.r0*np.cos(t)
+    ys = loop.y0 + loop.r0*np.sin(t)
+    zs = loop.z0*np.ones(len(t))
+
+    title = r"$B_0 = "+str(loop.B0)+"T, x_0 = "+str(loop.x0)+", y_0 = "+str(loop.y0)+", z_0 = "+str(loop.z0)+", r_0 = $"+str(loop.r0)
+
+    fig, ax = _figure(fig,figsize,"3d")
+    ax.set_xlabel(r"x",fontsize=15)
+    ax.set_ylabel(r"y",fontsize=15)
+    ax.set_zlabel(r"z",fontsize=15)
+    ax.set_title(title,fontsize=15)
+    ax.quiver(x, y, z, Bx, By, Bz, length=loop.r0*0.2, normalize=True, color = colorArrow)
+    ax.plot(xs,ys,zs,color=colorLoop,linewidth=linewidth)
+
+    return fig
+
+def displayLoopField2D(loop,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True,fig=None):
+    """
+    To display the field of a loop in a plane, see Loop.displayField2D
+    """
+    nb_points = int(nb_points)
+    fig, ax = _figure(fig,figsize)
+
+
+    if eq_0 == "x":
+        x1, x2 = np.meshgrid(np.linspace(-2*loop.r0+loop.y0, 2*loop.r0+loop.y0, nb_points),np.linspace(-2*loop.r0+loop.z0, 2*loop.r0+loop.z0, nb_points))
+        x3 = np.zeros_like(x1)+loop.x0
+        Bx3, Bx1, Bx2 = loop.field(x3, x1, x2)
+        dotx1 = np.array([-loop.r0,loop.r0])+loop.y0
+        dotx2 = [loop.z0,loop.z0]
+        xlabel = r"$y$"
+        ylabel = r"$z$"
+        title = r"x = "+str(loop.x0)
+
+    elif eq_0 == "y":
+        x1, x2 = np.meshgrid(np.linspace(-2*loop.r0+loop.x0, 2*loop.r0+loop.x0, nb_points),np.linspace(-2*loop.r0+loop.z0, 2*loop.r0+loop.z0, nb_points))
+        x3 = np.zeros_like(x1)+loop.y0
+        Bx1, Bx3, Bx2 = loop.field(x1, x3, x2)
+        dotx1 = np.array([-loop.r0,loop.r0])+loop.x0
+        dotx2 = [loop.z0,loop.z0]
+        xlabel = r"$x$"
+        ylabel = r"$z$"
+        title = r"y = "+str(loop.y0)
+
+    else:
+        print("Your choice of plan is incorrect")
+        return fig        
+
+    no = np.sqrt(Bx1**2+Bx2**2+Bx3**2)
+    Bx1 = Bx1/no
+    Bx2 = Bx2/no
+
+    ax.set_title(r"$B_0 = $"+str(loop.B0)+"$T$, "+title,fontsize=15)
+    ax.set_xlabel(xlabel,fontsize=15)
+    ax.set_ylabel(ylabel,fontsize=15)
+    ax.quiver(x1,x2,Bx1,Bx2,color=color)
+
+    if markLoop:
+        ax.plot(dotx1,dotx2,'.',ms=15,color="red")
+    fig.tight_layout()
+
+    return fig
+
+def plotFieldMainAxis(source,zmin,zmax,nbpoints=100,figsize=(8,5)):
+    """
+    To plot the field of a loop or a solenoid on its main axis, see
+    Loop.plotFieldMainAxis
+    """
+    nbpoints = int(nbpoints)
+    z = np.linspace(zmin,zmax,nbpoints)+source.z0
+    x = np.zeros_like(z)+source.x0
+    y = np.zeros_like(z)+source.y0
+
+    Bx, By, Bz = source.field(x,y,z)
+
+    fig = plt.figure(figsize=figsize)
+
+    plt.plot(z,Bz)
+    plt.xlabel(r"$z$ $(m)$",fontsize=15)
+    plt.ylabel(r"$B_z$ $(T)$",fontsize=15)
+    plt.title("Magnetic field on the main axis",fontsize=15)
+    plt.axis([min(z),max(z),min(Bz),max(Bz)*1.1])
+    plt.grid()
+
+
+    plt.tight_layout()
+
+    return fig
+
+def displaySolenoid(sol,figsize=(10,10),color="red",linewidth=1,maxLoops=500,fig=None):
+    """
+    To display a solenoid, see Solenoid.displaySolenoid
+    """
+    title = r"$I = "+str(sol.I)+"A, x_0 = "+str(sol.x0)+", y_0 = "+str(sol.y0)+", z_0 = "+str(sol.z0)+", r_0 = $"+str(sol.r0)+", N = "+str(sol.N)+", L = "+str(sol.L)
+
+    fig, ax = _figure(fig,figsize,"3d")
+    ax.set_xlabel(r"x",fontsize=15)
+    ax.set_ylabel(r"y",fontsize=15)
+    ax.set_zlabel(r"z",fontsize=15)
+    ax.set_title(title,fontsize=15)
+
+    turns = _displayedTurns(len(sol.radii),maxLoops)
+    _drawCircles(ax,sol.centers[turns],sol.radii[turns],color,linewidth)
+
+    return fig
+
+def displaySolenoidField3D(sol,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=1,maxLoops=500,fig=None):
+    """
+    To display the field of a solenoid in 3D, see Solenoid.displayField3D
+    """
+    x, y, z = np.meshgrid(np.linspace(-3*sol.r0+sol.x0, 3*sol.r0+sol.x0, nb_points),
+                          np.linspace(-3*sol.r0+sol.y0, 3*sol.r0+sol.y0, nb_points),
+                          np.linspace(sol.z0-sol.L,sol.z0+sol.L, nb_points))
+    x = np.concatenate(np.concatenate(x))
+    y = np.concatenate(np.concatenate(y))
+    z = np.concatenate(np.concatenate(z))
+    Bx, By, Bz = sol.field(x,y,z)
+
+    title = r"$I = "+str(sol.I)+"A, x_0 = "+str(sol.x0)+", y_0 = "+str(sol.y0)+", z_0 = "+str(sol.z0)+", r_0 = $"+str(sol.r0)+", N = "+str(sol.N)+", L = "+str(sol.L)
+
+    fig, ax = _figure(fig,figsize,"3d")
+    ax.set_xlabel(r"x",fontsize=15)
+    ax.set_ylabel(r"y",fontsize=15)
+    ax.set_zlabel(r"z",fontsize=15)
+    ax.set_title(title,fontsize=15)
+    ax.quiver(x, y, z, Bx, By, Bz, length=sol.r0*0.2, normalize=True, color = colorArrow)
+
+    turns = _displayedTurns(len(sol.radii),maxLoops)
+    _drawCircles(ax,sol.centers[turns],sol.radii[turns],colorLoop,linewidth)
+
+    return fig
+
+def displaySolenoidField2D(sol,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True,maxLoops=500,fig=None):
+    """
+    To display the field of a solenoid in a plane, see
+    Solenoid.displayField2D
+    """
+    nb_points = int(nb_points)
+    fig, ax = _figure(fig,figsize)
+
+    title = r"$I = "+str(sol.I)+"A, x_0 = "+str(sol.x0)+", y_0 = "+str(sol.y0)+", z_0 = "+str(sol.z0)+", r_0 = $"+str(sol.r0)+", N = "+str(sol.N)+", L = "+str(sol.L)
+    if eq_0 == "x":
+        xlabel = r"$y$"
+        ylabel = r"$z$"
+        title += r", $x = "+str(sol.x0)+"$"
+        x1, x2 = np.meshgrid(np.linspace(-3*sol.r0+sol.y0, 3*sol.r0+sol.y0, nb_points),np.linspace(sol.z0-sol.L,sol.z0+sol.L, nb_points))
+        x3 = np.zeros_like(x1)+sol.x0
+        Bx3, Bx1, Bx2 = sol.field(x3, x1, x2)
+
+    elif eq_0 == "y":
+        xlabel = r"$x$"
+        ylabel = r"$z$"
+        title += r", $y = "+str(sol.y0)+"$"
+        x1, x2 = np.meshgrid(np.linspace(-3*sol.r0+sol.x0, 3*sol.r0+sol.x0, nb_points),np.linspace(sol.z0-sol.L,sol.z0+sol.L, nb_points))
+        x3 = np.zeros_like(x1)+sol.y0
+        Bx1, Bx3, Bx2 = sol.field(x1, x3, x2)
+    else:
+        print("Your choice of plan is incorrect")
+        return fig
+
+    if markLoop:
+        # both crossings of the plane by all the loops, as one set of markers
+        turns = _displayedTurns(len(sol.radii),maxLoops)
+        center = sol.centers[turns,1 if eq_0 == "x" else 0]
+        radius = sol.radii[turns]
+        dotx1 = np.concatenate([center-radius,center+radius])
+        dotx2 = np.tile(sol.centers[turns,2],2)
+        ax.plot(dotx1,dotx2,'.',ms=5,color="red")
+
+    no = np.sqrt(Bx1**2+Bx2**2+Bx3**2)
+    Bx1 = Bx1/no
+    Bx2 = Bx2/no
+
+    ax.quiver(x1,x2,Bx1,Bx2,color=color)
+
+
+    ax.set_title(title,fontsize=15)
+    ax.set_xlabel(xlabel,fontsize=15)
+    ax.set_ylabel(ylabel,fontsize=15)
+    fig.tight_layout()
+
+    return fig
+
+def colormapField(sol, figsize=(6,5), nbpoints=200):
+    """
+    To do colormaps of the field of a solenoid, see Solenoid.colormapField
+    """
+    d = np.linspace(-sol.L,sol.L,200)
+    x, z = np.meshgrid(d,d)
+    y = np.zeros_like(x)
+    x += sol.x0
+    y += sol.y0
+    y += sol.y0
+
+    Bx, By, Bz = sol.field(x,y,z)
+    B = np.sqrt(Bx**2+By**2+Bz**2)
+
+    m = np.max(np.abs(Bz))
+    x01 = - sol.r0
+    z01 = - sol.L/2
+    x02 = sol.r0
+    z02 = sol.L/2
+
+    fig1 = plt.figure(figsize=(6,5))
+    im = plt.imshow(Bx,cmap=plt.cm.seismic, extent=(-sol.L,sol.L,-sol.L,sol.L), origin='lower',vmin=-m,vmax=m)
+    plt.plot([x01,x01],[z01,z02],lw=2,color='black')
+    plt.plot([x02,x02],[z01,z02],lw=2,color='black')
+    plt.colorbar(im)
+    plt.title(r"$Br$",fontsize=15)
+    plt.xlabel(r"$r$",fontsize=15)
+    plt.ylabel(r"$z$",fontsize=15)
+    plt.tight_layout()
+
+
+    fig2 = plt.figure(figsize=(6,5))
+    im = plt.imshow(Bz,cmap=plt.cm.seismic, extent=(-sol.L,sol.L,-sol.L,sol.L), origin='lower',vmin=-m,vmax=m)
+    plt.plot([x01,x01],[z01,z02],color='black')
+    plt.plot([x02,x02],[z01,z02],color='black')
+    plt.colorbar(im)
+    plt.title(r"$B_z$",fontsize=15)
+    plt.xlabel(r"$r$",fontsize=15)
+    plt.ylabel(r"$z$",fontsize=15)
+    plt.tight_layout()
+
+    fig3 = plt.figure(figsize=(6,5))
+    im = plt.imshow(B,cmap=plt.cm.seismic, extent=(-sol.L,sol.L,-sol.L,sol.L), origin='lower',vmin=-m,vmax=m)
+    plt.plot([x01,x01],[z01,z02],color='black')
+    plt.plot([x02,x02],[z01,z02],color='black')
+    plt.colorbar(im)
+    plt.title(r"$|B|$",fontsize=15)
+    plt.xlabel(r"$r$",fontsize=15)
+    plt.ylabel(r"$z$",fontsize=15)
+    plt.tight_layout()
+    return fig1, fig2, fig3
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+
+To render the figures described by a job file, in parallel processes with
+the Agg backend
+
+* Usage
+    python -m Solenoyds.Render figures.json --workers 4
+    python -m Solenoyds.Render figures.json --force
+
+The job file lists the coils, with their type and the arguments of their
+constructor, and the figures, with a coil, a plotting method, its arguments
+and the output files:
+
+    {"coils": {"sol": {"type": "Solenoid", "n": 1000, "I": 100, "L": 5}},
+     "jobs": [{"coil": "sol", "plot": "plotFieldMainAxis",
+               "args": {"zmin": -5, "zmax": 5}, "output": "axis_sol.png"},
+              {"coil": "sol", "plot": "colormapField",
+               "output": ["colormap1.png", "colormap2.png", "colormap3.png"]}]}
+
+A job can also have a "name", used in the log, and "savefig", the keyword
+arguments of Figure.savefig. The outputs are relative to the directory of
+the job file. The file <job file>.stamps records, for each output, a hash
+of the coil, the job and the source of Solenoyds: a job whose outputs exist
+with the same hash is skipped.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+_PLOTS = ("plotFieldMainAxis","colormapField","displayLoop","displaySolenoid","displayField2D","displayField3D")
+
+def _coil(spec):
+    """
+    To build a coil from its description
+
+    * Arguments
+        - spec: dict
+            "type" ("Loop" or "Solenoid") and the arguments of the constructor
+
+    * Returns
+        - coil: Loop or Solenoid
+            the coil
+    """
+    spec = dict(spec)
+    kind = spec.pop("type","Solenoid")
+    if kind == "Loop":
+        from Solenoyds.Loop import Loop
+        return Loop(**spec)
+    if kind == "Solenoid":
+        from Solenoyds.Solenoid import Solenoid
+        return Solenoid(**spec)
+    raise ValueError("type must be \"Loop\" or \"Solenoid\"")
+
+def _sourceHash():
+    """
+    To hash the source of Solenoyds, so that the figures are rendered again
+    after a change of the code
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            with open(os.path.join(directory,name),"rb") as f:
+                digest.update(name.encode()+f.read())
+    return digest.hexdigest()
+
+def _stamp(job,coil,source):
+    """
+    To hash the inputs of a job
+    """
+    inputs = {"coil":coil,"plot":job["plot"],"args":job.get("args",{}),"savefig":job.get("savefig",{}),
+              "output":job["output"],"source":source}
+    return hashlib.sha256(json.dumps(inputs,sort_keys=True).encode()).hexdigest()
+
+def _upToDate(root,outputs,stamp,stamps):
+    """
+    To know whether all the outputs exist with the same stamp
+    """
+    return all(stamps.get(output) == stamp and os.path.exists(os.path.join(root,output)) for output in outputs)
+
+def _initWorker():
+    """
+    To select the non-interactive backend in a worker process
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _render(job,coil,outputs):
+    """
+    To render one job, in a worker process
+
+    * Arguments
+        - job: dict
+            the job, see the module docstring
+        - coil: dict
+            the description of the coil
+        - outputs: list(string)
+            the paths of the output files
+
+    * Returns
+        - duration: float
+            the time in seconds
+    """
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    figures = getattr(_coil(coil),job["plot"])(**job.get("args",{}))
+    if not isinstance(figures,tuple):
+        figures = (figures,)
+    if len(figures) != len(outputs):
+        plt.close("all")
+        raise ValueError(job["plot"]+" gives "+str(len(figures))+" figure(s) for "+str(len(outputs))+" output(s)")
+    for fig, output in zip(figures,outputs):
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory,exist_ok=True)
+        fig.savefig(output,**job.get("savefig",{}))
+        plt.close(fig)
+    return time.perf_counter()-start
+
+def render(filename,workers=None,force=False,log=print):
+    """
+    To render the figures of a job file
+
+    * Arguments
+        - filename: string
+            the job file
+        - workers: int
+            number of processes, None for the number of processors
+        - force: boolean
+            to render the jobs whose outputs are up to date
+        - log: function
+            called with one line for each job
+
+    * Returns
+        - failures: list(string)
+            the names of the jobs which failed
+
+    * Example
+        failures = render("figures.json",workers=4)
+    """
+    with open(filename) as f:
+        description = json.load(f)
+    root = os.path.dirname(os.path.abspath(filename))
+    coils = description.get("coils",{})
+    source = _sourceHash()
+    stampFile = os.path.abspath(filename)+".stamps"
+    try:
+        with open(stampFile) as f:
+            stamps = json.load(f)
+    except (OSError,ValueError):
+        stamps = {}
+
+    pending = []
+    for i, job in enumerate(description.get("jobs",[])):
+        outputs = job.get("output")
+        outputs = [outputs] if isinstance(outputs,str) else list(outputs or [])
+        name = job.get("name",", ".join(outputs) or "job "+str(i))
+        if job.get("plot") not in _PLOTS:
+            raise ValueError(name+": plot must be one of "+", ".join(_PLOTS))
+        if job.get("coil") not in coils:
+            raise ValueError(name+": unknown coil "+str(job.get("coil")))
+        if not outputs:
+            raise ValueError(name+": no output")
+        coil = coils[job["coil"]]
+        stamp = _stamp(job,coil,source)
+        if not force and _upToDate(root,outputs,stamp,stamps):
+            log("%-50s %12s" % (name,"up to date"))
+            continue
+        pending.append((name,job,coil,outputs,stamp))
+
+    failures = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers,initializer=_initWorker) as executor:
+        futures = [(name,outputs,stamp,executor.submit(_render,job,coil,[os.path.join(root,output) for output in outputs])) for name, job, coil, outputs, stamp in pending]
+        for name, outputs, stamp, future in futures:
+            try:
+                log("%-50s %10.3f s" % (name,future.result()))
+            except Exception as error:
+                failures.append(name)
+                log("%-50s %12s  %s" % (name,"FAILED",error))
+                continue
+            # the stamps are written after each job, so that an interrupted
+            # run keeps the figures already rendered
+            stamps.update((output,stamp) for output in outputs)
+            with open(stampFile,"w") as f:
+                json.dump(stamps,f,indent=1,sort_keys=True)
+    log("%d job(s) rendered, %d skipped, %d failed in %.3f s" %
+        (len(pending)-len(failures),len(description.get("jobs",[]))-len(pending),len(failures),time.perf_counter()-start))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the figures of a job file in parallel")
+    parser.add_argument("jobs",help="JSON job file")
+    parser.add_argument("--workers",type=int,default=None,help="number of processes (default: number of processors)")
+    parser.add_argument("--force",action="store_true",help="render the jobs whose outputs are up to date")
+    args = parser.parse_args(argv)
+    return 1 if render(args.jobs,args.workers,args.force) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
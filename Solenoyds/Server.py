@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+
+To serve the field of a coil to the processes of a host, over a Unix socket
+or a localhost TCP port
+
+* Usage
+    python -m Solenoyds.Server coil.json --socket /tmp/solenoid.sock
+    python -m Solenoyds.Server coil.json --port 8765
+
+The coil file describes one coil as in the job files of Render.py, for
+instance {"type": "Solenoid", "n": 1000, "L": 5}. The coil is built once,
+and the requests received while a batch is computed are merged into the
+next batch.
+
+* Protocol
+    Each message starts with a header "<BQ": a code and a length. The
+    requests are (0, P) followed by x, y and z, the field in P points, (1, P)
+    followed by r and z, the field in cylindrical coordinates, and (2, 0),
+    the description of the coil. The responses are (0, n) followed by n
+    values, (1, n) followed by n bytes of JSON, or (2, n) followed by an
+    error message of n bytes. The values are little-endian float64.
+"""
+import os
+import sys
+import json
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+import numpy as np
+from Solenoyds.Cache import _geometry
+
+_HEADER = struct.Struct("<BQ")
+_FIELD, _FIELD_RZ, _INFO = 0, 1, 2
+_VALUES, _JSON, _ERROR = 0, 1, 2
+# number of coordinates sent, and of components returned, for each request
+_SIZES = {_FIELD:(3,3),_FIELD_RZ:(2,2)}
+
+class FieldServer:
+    """
+    To serve the field of a coil with asyncio, merging the concurrent
+    requests into batches
+
+    Each kind of request has a queue. A batch takes the first request of the
+    queue, then all the requests already waiting, and the ones arriving
+    within delay seconds, up to maxBatch points. The field of the batch is
+    computed in a thread, so that the next requests are read meanwhile.
+
+    * Attributes
+        - self.source: Loop, Solenoid...
+            the coil, with the methods field and field_rz
+        - self.path: String
+            the path of the Unix socket, None for TCP
+        - self.host, self.port: String, int
+            the TCP address, the port is known after start
+        - self.maxBatch: int
+            the largest number of points of a batch, except for a single
+            larger request
+        - self.delay: float
+            the time in seconds a batch waits for more requests
+        - self.requests: int
+            number of field requests served
+        - self.batches: int
+            number of evaluations of the field
+    """
+    def __init__(self,source,path=None,host="127.0.0.1",port=0,maxBatch=2**16,delay=0.0):
+        """
+        * Arguments
+            - source: Loop, Solenoid...
+                the coil
+            - path: String
+                the path of the Unix socket, None to use TCP
+            - host: String
+                the TCP host (default localhost)
+            - port: int
+                the TCP port, 0 for any free port
+            - maxBatch: int
+                the largest number of points of a batch
+            - delay: float
+                the time in seconds a batch waits for more requests
+
+        * Example
+            server = FieldServer(Solenoid(n=1000),path="/tmp/solenoid.sock")
+            asyncio.run(server.serve_forever())
+        """
+        self.source = source
+        self.path = path
+        self.host = host
+        self.port = port
+        self.maxBatch = int(maxBatch)
+        self.delay = float(delay)
+        self.requests = 0
+        self.batches = 0
+        self._server = None
+        self._queues = None
+        self._tasks = []
+        self._connections = set()
+
+    def __str__(self):
+        address = self.path if self.path is not None else self.host+":"+str(self.port)
+        return "FieldServer "+address+", "+str(self.requests)+" requests in "+str(self.batches)+" batches"
+
+    async def start(self):
+        """
+        To listen for connections and to start the batches
+        """
+        self._queues = {op:asyncio.Queue() for op in _SIZES}
+        self._tasks = [asyncio.ensure_future(self._batches(op)) for op in _SIZES]
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._handle,path=self.path)
+        else:
+            self._server = await asyncio.start_server(self._handle,self.host,self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """
+        To start the server and to serve until it is closed
+        """
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        To stop listening, to close the connections and to stop the batches
+        """
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await self._server.wait_closed()
+            self._server = None
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _batches(self,op):
+        """
+        To compute the requests of a queue by batches
+        """
+        queue = self._queues[op]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            points = batch[0][0].shape[1]
+            deadline = loop.time()+self.delay
+            while points < self.maxBatch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                else:
+                    timeout = deadline-loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(),timeout))
+                    except asyncio.TimeoutError:
+                        break
+                points += batch[-1][0].shape[1]
+            coordinates = np.concatenate([request for request, future in batch],axis=1)
+            method = self.source.field if op == _FIELD else self.source.field_rz
+            try:
+                B = await loop.run_in_executor(None,lambda: np.array(method(*coordinates),dtype="<f8"))
+            except Exception as error:
+                for request, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            start = 0
+            for request, future in batch:
+                stop = start+request.shape[1]
+                if not future.done():
+                    future.set_result(B[:,start:stop])
+                start = stop
+
+    async def _handle(self,reader,writer):
+        """
+        To answer the requests of a connection, one after the other
+        """
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    op, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if op == _INFO:
+                    info = {name:value for name, value in _geometry(self.source).items() if not isinstance(value,list)}
+                    message = json.dumps(info).encode()
+                    writer.write(_HEADER.pack(_JSON,len(message))+message)
+                elif op in _SIZES:
+                    size = _SIZES[op][0]
+                    data = await reader.readexactly(8*size*length)
+                    coordinates = np.frombuffer(data,dtype="<f8").reshape(size,length)
+                    future = asyncio.get_running_loop().create_future()
+                    await self._queues[op].put((coordinates,future))
+                    try:
+                        B = await future
+                    except Exception as error:
+                        message = (type(error).__name__+": "+str(error)).encode()
+                        writer.write(_HEADER.pack(_ERROR,len(message))+message)
+                    else:
+                        writer.write(_HEADER.pack(_VALUES,B.size)+B.tobytes())
+                else:
+                    message = ("unknown request "+str(op)).encode()
+                    writer.write(_HEADER.pack(_ERROR,len(message))+message)
+                    break
+                await writer.drain()
+        except (ConnectionError,asyncio.IncompleteReadError,asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+class FieldClient:
+    """
+    To compute the field with a FieldServer, as with the coil itself
+
+    The connection is opened on the first request and reused by the next
+    ones. It can be shared by several threads, whose requests are sent one
+    after the other. The attributes of the coil which are numbers or strings
+    (x0, r0, N...) are read from the server.
+
+    * Attributes
+        - self.path: String
+            the path of the Unix socket, None for TCP
+        - self.host, self.port: String, int
+            the TCP address
+        - self.timeout: float
+            the timeout of the socket in seconds, None for none
+    """
+    def __init__(self,path=None,host="127.0.0.1",port=None,timeout=None):
+        """
+        * Arguments
+            - path: String
+                the path of the Unix socket, None to use TCP
+            - host: String
+                the TCP host (default localhost)
+            - port: int
+                the TCP port
+            - timeout: float
+                the timeout of the socket in seconds, None for none
+
+        * Example
+            sol = FieldClient("/tmp/solenoid.sock")
+            Bx, By, Bz = sol.field(0,0,np.linspace(-1,1,100))
+        """
+        if path is None and port is None:
+            raise ValueError("path or port must be given")
+        self.path = path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+        self._info = None
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        address = self.path if self.path is not None else self.host+":"+str(self.port)
+        return "FieldClient "+address
+
+    def __getattr__(self,name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._info is None:
+            self._info = json.loads(self._request(_INFO,np.empty((0,0))))
+        try:
+            return self._info[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exception):
+        self.close()
+
+    def close(self):
+        """
+        To close the connection, opened again by the next request
+        """
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _connect(self):
+        if self.path is not None:
+            sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            address = self.path
+        else:
+            sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            address = (self.host,self.port)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        return sock
+
+    def _receive(self,size):
+        data = bytearray(size)
+        view = memoryview(data)
+        while view:
+            n = self._socket.recv_into(view)
+            if n == 0:
+                raise ConnectionError("connection closed by the server")
+            view = view[n:]
+        return data
+
+    def _request(self,op,coordinates):
+        """
+        To send a request and to get the content of the response, once
+        again on a new connection if the reused one was closed
+        """
+        payload = np.ascontiguousarray(coordinates,dtype="<f8").tobytes()
+        message = _HEADER.pack(op,coordinates.shape[1] if op != _INFO else 0)+payload
+        with self._lock:
+            for attempt in (0,1):
+                fresh = self._socket is None
+                try:
+                    if fresh:
+                        self._socket = self._connect()
+                    self._socket.sendall(message)
+                    code, length = _HEADER.unpack(self._receive(_HEADER.size))
+                    break
+                except (ConnectionError,BrokenPipeError):
+                    if self._socket is not None:
+                        self._socket.close()
+                        self._socket = None
+                    if fresh or attempt:
+                        raise
+            data = self._receive(8*length if code == _VALUES else length)
+        if code == _ERROR:
+            raise ValueError("server error: "+data.decode())
+        if code == _JSON:
+            return data.decode()
+        return np.frombuffer(data,dtype="<f8")
+
+    def _evaluate(self,op,dtype,*coordinates):
+        coordinates = np.broadcast_arrays(*[np.asarray(c,dtype=float) for c in coordinates])
+        shape = coordinates[0].shape
+        B = self._request(op,np.stack([c.ravel() for c in coordinates]))
+        B = B.reshape((_SIZES[op][1],)+shape).astype(dtype,copy=False)
+        # numpy scalars for scalar coordinates, as the sources
+        return tuple(B[i] for i in range(len(B)))
+
+    def field(self,x,y,z,dtype=np.float64):
+        """
+        To compute the magnetic field, see Solenoid.field
+
+        * Arguments
+            - x, y, z: np.array(float)
+                the coordinates
+            - dtype: np.dtype
+                np.float64, or np.float32 to return the field in single
+                precision, computed in double precision by the server
+
+        * Returns
+            - Bx, By, Bz: (np.array(float),np.array(float),np.array(float))
+                The magnetic field
+        """
+        return self._evaluate(_FIELD,dtype,x,y,z)
+
+    def field_rz(self,r,z,dtype=np.float64):
+        """
+        To compute the magnetic field in cylindrical coordinates, see
+        Solenoid.field_rz
+
+        * Arguments
+            - r, z: np.array(float)
+                the distance from the axis and the z coordinate
+            - dtype: np.dtype
+                np.float64 or np.float32
+
+        * Returns
+            - Br, Bz: (np.array(float),np.array(float))
+                The radial and axial magnetic field
+        """
+        return self._evaluate(_FIELD_RZ,dtype,r,z)
+
+def main(argv=None):
+    from Solenoyds.Render import _coil
+    parser = argparse.ArgumentParser(description="Serve the field of a coil")
+    parser.add_argument("coil",help="JSON file describing the coil")
+    parser.add_argument("--socket",help="path of the Unix socket")
+    parser.add_argument("--host",default="127.0.0.1",help="TCP host (default: 127.0.0.1)")
+    parser.add_argument("--port",type=int,default=0,help="TCP port, used without --socket (default: any free port)")
+    parser.add_argument("--max-batch",type=int,default=2**16,help="largest number of points of a batch")
+    parser.add_argument("--delay",type=float,default=0.0,help="time in seconds a batch waits for more requests")
+    args = parser.parse_args(argv)
+    with open(args.coil) as f:
+        source = _coil(json.load(f))
+    server = FieldServer(source,args.socket,args.host,args.port,args.max_batch,args.delay)
+
+    async def run():
+        await server.start()
+        print("serving "+str(source).split("\n")[0]+" on "+(args.socket or args.host+":"+str(server.port)),flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    print(server)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
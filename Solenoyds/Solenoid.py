@@ -6,9 +6,200 @@ https://github.com/sniang/Solenoyds
 https://sniang.github.io/Solenoyds
 """
 import numpy as np
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.pyplot as plt
-from Solenoyds.Loop import Loop
+import time
+import warnings
+from Solenoyds.Export import writeField, writeFieldMap, fieldMapSlabs
+from Solenoyds.Loop import Loop, _loopsFieldRZ, _toCartesian, _inParallel, _agmSteps, _ELLIPTIC_CHUNK
+from Solenoyds.Loop import _fieldRZ, _ellipKED, _gradientRZ, _toCartesianGradient
+from Solenoyds import Stats
+
+def _sheetIntegrals(kc2,gamma):
+    """
+    To compute the two complete elliptic integrals of the field of a current
+    sheet together, with one arithmetic-geometric mean iteration
+
+    P1 = cel(kc,1,1,-1) and P2 = cel(kc,gamma^2,1,gamma), with the general
+    complete elliptic integral cel of Bulirsch, whose iteration is the
+    arithmetic-geometric mean of 1 and kc shared by both integrals. As in
+    _ellipKE, the elements are processed by chunks, each with the number of
+    steps needed by its smallest kc^2.
+
+    * Arguments
+        - kc2: np.array(float)
+            the complementary parameter 1-m, between 0 and 1
+        - gamma: np.array(float)
+            (r0-r)/(r0+r), between -1 and 1, broadcast against kc2
+
+    * Returns
+        - P1, P2: (np.array(float),np.array(float))
+            the integrals, with the shape of kc2 and gamma
+    """
+    kc2, gamma = np.broadcast_arrays(np.asarray(kc2,dtype=float),np.asarray(gamma,dtype=float))
+    P1 = np.empty(kc2.shape)
+    P2 = np.empty(kc2.shape)
+    flat, gammaf, P1f, P2f = kc2.reshape(-1), gamma.reshape(-1), P1.reshape(-1), P2.reshape(-1)
+    for i in range(0,flat.size,_ELLIPTIC_CHUNK):
+        chunk = slice(i,i+_ELLIPTIC_CHUNK)
+        kc = np.sqrt(flat[chunk])
+        e = kc.copy()
+        m = np.ones_like(kc)
+        t = np.empty_like(kc)
+        u = np.empty_like(kc)
+        v = np.empty_like(kc)
+        # P1: p stays equal to m, a1 = 1, b1 = -1
+        a1 = np.ones_like(kc)
+        b1 = -np.ones_like(kc)
+        # P2: p = |gamma| and b2 = gamma/|gamma| after the first substitution
+        # of Bulirsch, on the sheet itself (gamma = 0) P2 is replaced by K,
+        # the mean of its limits on both sides
+        p2 = np.abs(gammaf[chunk])
+        b2 = np.sign(gammaf[chunk])
+        p2[p2 == 0] = 1
+        b2[b2 == 0] = 1
+        a2 = np.ones_like(kc)
+        for _ in range(_agmSteps(np.fmin.reduce(flat[chunk]))+1):
+            np.multiply(a1,kc,out=t)
+            np.divide(b1,m,out=u)
+            a1 += u
+            b1 += t
+            b1 *= 2
+            np.divide(e,p2,out=u)
+            np.multiply(a2,u,out=t)
+            np.divide(b2,p2,out=v)
+            a2 += v
+            b2 += t
+            b2 *= 2
+            p2 += u
+            np.multiply(kc,m,out=e)
+            m += kc
+            np.sqrt(e,out=kc)
+            kc *= 2
+            np.multiply(kc,m,out=e)
+        np.multiply(a1,m,out=t)
+        t += b1
+        np.multiply(m,m,out=u)
+        np.divide(t,u,out=P1f[chunk])
+        P1f[chunk] *= np.pi/4
+        np.multiply(a2,m,out=t)
+        t += b2
+        np.add(m,p2,out=u)
+        u *= m
+        np.divide(t,u,out=P2f[chunk])
+        P2f[chunk] *= np.pi/2
+    return P1, P2
+
+def _sheetFieldRZ(B0,r0,b,r,z):
+    """
+    To compute the magnetic field of an ideal finite current sheet in cylindrical coordinates
+
+    Closed form of Derby and Olbert (Am. J. Phys. 78, 229 (2010)), with the
+    complete elliptic integrals computed by _sheetIntegrals.
+
+    * Arguments
+        - B0: float
+            magnetic field inside the sheet if it were infinite (mu0*n*I)
+        - r0: float
+            the radius of the sheet
+        - b: float
+            the half length of the sheet
+        - r: np.array(float)
+            the distance from the axis
+        - z: np.array(float)
+            the coordinate along the axis, relative to the center of the sheet
+
+    * Returns
+        - Br, Bz: (np.array(float),np.array(float))
+            The radial and axial magnetic field, nan on the edges of the sheet
+    """
+    stats = Stats._active
+    if stats is not None:
+        start = time.perf_counter()
+        elliptic = 0
+        nearSingular = False
+        onWire = False
+    gamma = (r0-r)/(r0+r)
+    Br = 0
+    Bz = 0
+    for sign, zi in ((1,z+b),(-1,z-b)):
+        D2 = zi**2+(r0+r)**2
+        kc2 = (zi**2+(r0-r)**2)/D2
+        onEdge = kc2 == 0
+        if np.any(onEdge):
+            warnings.warn("Warning : you cannot estimate the field on the edges of the solenoid")
+            kc2 = np.where(onEdge,np.nan,kc2)
+        if stats is not None:
+            nearSingular = nearSingular | (kc2 < Stats.NEAR_SINGULAR)
+            onWire = onWire | onEdge
+            elliptic -= time.perf_counter()
+        P1, P2 = _sheetIntegrals(kc2,gamma)
+        if stats is not None:
+            elliptic += time.perf_counter()
+        D = np.sqrt(D2)
+        Br = Br+sign*r0/D*P1
+        Bz = Bz+sign*zi/D*P2
+    if stats is not None:
+        stats._kernel(np.size(Bz),np.count_nonzero(np.broadcast_to(r == 0,np.shape(Bz))),
+                      np.count_nonzero(nearSingular),np.count_nonzero(onWire),
+                      elliptic,time.perf_counter()-start)
+    return B0/np.pi*Br, B0/np.pi*r0/(r0+r)*Bz
+
+def _sheetGradientRZ(B0,r0,b,r,z):
+    """
+    To compute the magnetic field of an ideal finite current sheet and its
+    derivatives in cylindrical coordinates
+
+    The sheet is a continuous stack of loops with B0/(2 r0) per meter, so its
+    derivatives along z are the differences of the fields of the loops at
+    both ends, and Br/r is the difference of A/r, A being the vector
+    potential of these loops. The other derivatives follow from curl B = 0
+    and div B = 0, as in Solenoyds.Loop._gradientRZ.
+
+    * Arguments
+        - see _sheetFieldRZ
+
+    * Returns
+        - Br, Bz, BrOverR, dBzdr, dBzdz: tuple(np.array(float))
+            The radial and axial magnetic field, Br/r (-dBz/dz/2 on the
+            axis) and the derivatives of Bz, nan on the edges of the sheet
+    """
+    _, Bz = _sheetFieldRZ(B0,r0,b,r,z)
+    BrOverR = 0
+    dBzdr = 0
+    dBzdz = 0
+    a = r/r0
+    for sign, zi in ((1,z+b),(-1,z-b)):
+        c = zi/r0
+        Q = (1+a)**2+c**2
+        Q4 = (1-a)**2+c**2
+        Q4 = np.where(Q4 == 0,np.nan,Q4)
+        K, E, D, G = _ellipKED(Q4/Q,4*a/Q)
+        s = B0/(2*np.pi*r0*np.sqrt(Q))
+        # Bz and Br of the loop at the end, and -A/r = 8sG/Q
+        dBzdz = dBzdz+sign*s*(E*(1-a**2-c**2)/Q4+K)
+        dBzdr = dBzdr+sign*8*s*a*c*(G+D)/(Q*Q4)
+        BrOverR = BrOverR+sign*8*s*G/Q
+    return r*BrOverR, Bz, BrOverR, dBzdr, dBzdz
+
+class _LoopSequence:
+    """
+    A read-only sequence of the loops of a solenoid, whose Loop objects are
+    built from the arrays of the solenoid when they are accessed
+    """
+    def __init__(self,solenoid):
+        self._solenoid = solenoid
+
+    def __len__(self):
+        return len(self._solenoid.radii)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        sol = self._solenoid
+        x0, y0, z0 = sol.centers[i]
+        return Loop(sol.strengths[i],x0=x0,y0=y0,z0=z0,r0=sol.radii[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
 
 class Solenoid:
     """
@@ -35,11 +226,23 @@ class Solenoid:
             the axis of the solenoid
         - self.N: int(n*L)
             number of loops
-        - self.loops: array(Loop)
-            the loops
+        - self.centers: 2D np.array(float)
+            the centers of the loops, shape (N,3)
+        - self.radii: 1D np.array(float)
+            the radius of each loop
+        - self.strengths: 1D np.array(float)
+            the magnetic field at the center of each loop
+        - self.loops: sequence(Loop)
+            the loops, built from the arrays when they are accessed
+        - self.model: string
+            "loops" to sum the fields of the N loops,
+            "sheet" to use the closed form of an ideal current sheet
+        - self.cache: FieldCache
+            the cache of the computed fields (see Solenoyds.Cache),
+            None to compute them at each call
         
     """
-    def __init__(self,I=400,L=1,n=2000,x0=0,y0=0,z0=0,r0=0.5,axis="z"):
+    def __init__(self,I=400,L=1,n=2000,x0=0,y0=0,z0=0,r0=0.5,axis="z",model="loops"):
         """
         The constructor
         
@@ -60,11 +263,18 @@ class Solenoid:
             the radius of the loop
         - axis: string (for now, the only acceptable value is "z")
             the axis of the solenoid
+        - model: string
+            "loops" to sum the fields of the N loops,
+            "sheet" to use the closed form of an ideal current sheet of the
+            same I, n, L and r0, whose cost does not depend on N
         
         * Example
             sol = Solenoid(I=400,L=1,n=100,x0=0,y0=0,z0=0,r0=0.5,axis="z")
             print(sol)
+            sheet = Solenoid(I=400,L=1,n=100,model="sheet")
         """
+        if model not in ("loops","sheet"):
+            raise ValueError("model must be \"loops\" or \"sheet\"")
         N = int(n*L)
         mu0 = 4E-7*np.pi
         B0 = mu0*n*I
@@ -77,27 +287,37 @@ class Solenoid:
         self.y0 = y0
         self.z0 = z0
         self.r0 = r0
-        self.loops = []
         self.I = I
+        self.axis = axis
+        self.model = model
+        self.cache = None
         
         b0 = I*mu0/2/r0
         
+        self.centers = np.empty((N,3))
+        self.centers[:,0] = x0
+        self.centers[:,1] = y0
         if N == 1:
-            self.loops.append(Loop(b0,x0=x0,y0=y0,z0=z0,r0=r0))
+            self.centers[:,2] = z0
         else:
             d = L/(N-1)
-            for i in np.arange(N) :
-                self.loops.append(Loop(b0,x0=x0,y0=y0,z0=z0-L/2+i*d,r0=r0))
-        
-        
+            self.centers[:,2] = z0-L/2+np.arange(N)*d
+        self.radii = np.full(N,float(r0))
+        self.strengths = np.full(N,float(b0))
+        self.loops = _LoopSequence(self)
+
 
     def __str__(self):
         return "I = "+str(self.I)+", x0 = "+str(self.x0)+", y0 = "+str(self.y0)+", z0 = "+str(self.z0)+", r0 = "+str(self.r0)+", N = "+str(self.N)+", L = "+str(self.L)
 
-    def field(self,x,y,z):
+    def field(self,x,y,z,maxMemory=1e8,workers=1,dtype=np.float64):
         """
         To compute the magnetic field produced by the solenoid
         
+        All the loops are evaluated against all the points at once, by
+        blocks whose temporary arrays stay under maxMemory. With several
+        workers, the blocks are spread over a thread pool.
+        
         * Arguments
             - x: float
                 the x coordinate
@@ -105,6 +325,13 @@ class Solenoid:
                 the y coordinate
             - z: float
                 the y coordinate
+            - maxMemory: float
+                maximum memory in bytes used by the temporary arrays
+            - workers: int
+                number of threads sharing the points
+            - dtype: np.dtype
+                np.float64, or np.float32 to return the field in single
+                precision, with half the memory (see Solenoyds.Loop.FLOAT32_ERROR)
         
         * Returns
             - Bx, By, Bz: (float,float,float)
@@ -116,20 +343,142 @@ class Solenoid:
             x, y, z = np.meshgrid(l,l,l)
             Bx, By, Bz = sol.field(x, y, z)
         """
-        Bx = 0
-        By = 0
-        Bz = 0
+        if self.cache is not None:
+            return self.cache.field(self,lambda x,y,z: self._field(x,y,z,maxMemory,workers,dtype),x,y,z,dtype)
+        return self._field(x,y,z,maxMemory,workers,dtype)
+
+    def _field(self,x,y,z,maxMemory=1e8,workers=1,dtype=np.float64):
+        """
+        To compute the magnetic field produced by the solenoid, without the cache
+        """
+        x, y, z = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                      np.asarray(y,dtype=float)-self.y0,
+                                      np.asarray(z,dtype=float))
+        r = np.sqrt(x**2+y**2)
+        Br, Bz = self.field_rz(r,z,maxMemory,workers,dtype)
+        x = x.astype(dtype,copy=False)
+        y = y.astype(dtype,copy=False)
+        return _toCartesian(x,y,r.astype(dtype,copy=False),Br,Bz)
+
+    def field_rz(self,r,z,maxMemory=1e8,workers=1,dtype=np.float64):
+        """
+        To compute the magnetic field produced by the solenoid in cylindrical coordinates
+        
+        The field only depends on (r, z): with the "loops" model, the points
+        are first collapsed to their unique (r, |z-z0|) pairs, using the mirror
+        symmetry about the center of the solenoid when the positions, the
+        strengths and the radii of the turns are symmetric, and the results
+        are scattered back.
+        
+        * Arguments
+            - r: float
+                the distance from the axis of the solenoid
+            - z: float
+                the z coordinate
+            - maxMemory: float
+                maximum memory in bytes used by the temporary arrays
+            - workers: int
+                number of threads sharing the points
+            - dtype: np.dtype
+                np.float64, or np.float32 to return the field in single precision
         
-        for loop in self.loops:
-            bx, by, bz = loop.field(x,y,z)
-            Bx += bx
-            By += by
-            Bz += bz
-        return Bx, By, Bz
+        * Returns
+            - Br, Bz: (float,float)
+                The radial and axial magnetic field
+        
+        * Example
+            sol = Solenoid(n=100)
+            r, z = np.meshgrid(np.linspace(0,1,50),np.linspace(-1,1,100))
+            Br, Bz = sol.field_rz(r, z)
+        """
+        r, dz = np.broadcast_arrays(np.asarray(r,dtype=float),np.asarray(z,dtype=float)-self.z0)
+        if Stats._active is not None:
+            Stats._active._call(r.size,len(self.loops) if self.model == "loops" else 1)
+        if self.model == "sheet":
+            sheet = lambda r,z: _sheetFieldRZ(self.B0,self.r0,self.L/2,r,z)
+            Br, Bz = _inParallel(sheet,workers,r,dz)
+            return Br.astype(dtype,copy=False), Bz.astype(dtype,copy=False)
+        
+        return self._loopsRZ(r,dz,maxMemory,workers,dtype)
+
+    def _loopsRZ(self,r,dz,maxMemory=1e8,workers=1,dtype=np.float64,kernel=_fieldRZ,odd=(True,False)):
+        """
+        To sum the outputs of a kernel over the loops, computed once for each
+        unique (r, |z-z0|) pair and scattered back, the outputs listed as odd
+        changing sign with z-z0
+        """
+        B0 = self.strengths
+        r0 = self.radii
+        z0 = self.centers[:,2]-self.z0
+        
+        # the mirror symmetry holds only if the edited strengths and radii
+        # are symmetric too
+        sign = np.ones(dz.shape,dtype=dtype)
+        if (np.allclose(z0,-z0[::-1],rtol=0,atol=1e-12*max(self.L,self.r0))
+                and np.array_equal(B0,B0[::-1]) and np.array_equal(r0,r0[::-1])):
+            sign[dz < 0] = -1
+            dz = np.abs(dz)
+        
+        pairs, inverse = np.unique(np.stack([r.ravel(),dz.ravel()],axis=1),axis=0,return_inverse=True)
+        results = _loopsFieldRZ(B0,r0,z0,pairs[:,0],pairs[:,1],maxMemory,workers,dtype,kernel,len(odd))
+        inverse = inverse.reshape(r.shape)
+        return tuple(sign*B[inverse] if isOdd else B[inverse] for B, isOdd in zip(results,odd))
+
+    def field_and_gradient(self,x,y,z,maxMemory=1e8,workers=1):
+        """
+        To compute the magnetic field produced by the solenoid and its gradient
+        
+        The derivatives are analytic and computed in the same pass as the
+        field: from the derivatives of the field of each loop with the
+        "loops" model, from the fields of the loops at both ends with the
+        "sheet" model.
+        
+        * Arguments
+            - x: float
+                the x coordinate
+            - y: float
+                the y coordinate
+            - z: float
+                the z coordinate
+            - maxMemory: float
+                maximum memory in bytes used by the temporary arrays
+            - workers: int
+                number of threads sharing the points
+        
+        * Returns
+            - Bx, By, Bz: (float,float,float)
+                The magnetic field
+            - G: np.array(float)
+                the gradient of the field, G[...,i,j] = dB_i/dx_j, of shape
+                x.shape+(3,3)
+        
+        * Example
+            sol = Solenoid(n=100)
+            l = np.linspace(-1,1,10)
+            x, y, z = np.meshgrid(l,l,l)
+            Bx, By, Bz, G = sol.field_and_gradient(x, y, z)
+            dBzdz = G[...,2,2]
+        """
+        x, y, dz = np.broadcast_arrays(np.asarray(x,dtype=float)-self.x0,
+                                       np.asarray(y,dtype=float)-self.y0,
+                                       np.asarray(z,dtype=float)-self.z0)
+        if Stats._active is not None:
+            Stats._active._call(x.size,len(self.loops) if self.model == "loops" else 1)
+        r = np.sqrt(x**2+y**2)
+        if self.model == "sheet":
+            sheet = lambda r,z: _sheetGradientRZ(self.B0,self.r0,self.L/2,r,z)
+            results = _inParallel(sheet,workers,r,dz)
+        else:
+            # Br, Br/r and dBz/dz change sign with z-z0, Bz and dBz/dr do not
+            results = self._loopsRZ(r,dz,maxMemory,workers,np.float64,_gradientRZ,(True,False,True,False,True))
+        return _toCartesianGradient(x,y,r,*results)
     
-    def displaySolenoid(self,figsize=(10,10),color="red",linewidth=1):
+    def displaySolenoid(self,figsize=(10,10),color="red",linewidth=1,maxLoops=500,fig=None):
         """
         To display the solenoid
+
+        All the loops are drawn as one collection. Beyond maxLoops, only
+        maxLoops evenly spaced loops are drawn, with both ends.
         
         * Arguments
             - figsize: (float,float)
@@ -138,6 +487,10 @@ class Solenoid:
                 color of the loop
             - linewidth: float
                 thickness of the loop
+            - maxLoops: int
+                largest number of loops drawn, None for all of them
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
         * Returns
             - fig: matplotlib.pyplot.figure
                 the figure
@@ -147,26 +500,10 @@ class Solenoid:
             fig = sol.displaySolenoid()
             fig.savefig("sol.png")
         """
-        title = r"$I = "+str(self.I)+"A, x_0 = "+str(self.x0)+", y_0 = "+str(self.y0)+", z_0 = "+str(self.z0)+", r_0 = $"+str(self.r0)+", N = "+str(self.N)+", L = "+str(self.L)
-
-        fig = plt.figure(figsize=figsize)
-        ax = fig.gca(projection='3d')
-        ax.set_xlabel(r"x",fontsize=15)
-        ax.set_ylabel(r"y",fontsize=15)
-        ax.set_zlabel(r"z",fontsize=15)
-        ax.set_title(title,fontsize=15)
-        
-        t = np.linspace(0,2*np.pi,100)
-        
-        for loop in self.loops:
-            xs = loop.x0 + loop.r0*np.cos(t)
-            ys = loop.y0 + loop.r0*np.sin(t)
-            zs = loop.z0*np.ones(len(t))
-            ax.plot(xs,ys,zs,color=color,linewidth=linewidth)
-        
-        return fig
+        from Solenoyds import Plot
+        return Plot.displaySolenoid(self,figsize,color,linewidth,maxLoops,fig)
     
-    def displayField3D(self,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=1):
+    def displayField3D(self,figsize=(10,10),nb_points=8,colorLoop="red",colorArrow="blue",linewidth=1,maxLoops=500,fig=None):
         """
         To display the field in 3D
         * Arguments
@@ -180,6 +517,10 @@ class Solenoid:
                 color of the arrows
             - linewidth: float
                 thickness of the loops
+            - maxLoops: int
+                largest number of loops drawn, None for all of them
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
                 
         * Returns
             - fig: matplotlib.pyplot.figure
@@ -189,34 +530,10 @@ class Solenoid:
             fig = sol.displayField3D()
             fig.savefig("sol_3D.png")
         """
-        x, y, z = np.meshgrid(np.linspace(-3*self.r0+self.x0, 3*self.r0+self.x0, nb_points),
-                              np.linspace(-3*self.r0+self.y0, 3*self.r0+self.y0, nb_points),
-                              np.linspace(self.z0-self.L,self.z0+self.L, nb_points))
-        x = np.concatenate(np.concatenate(x))
-        y = np.concatenate(np.concatenate(y))
-        z = np.concatenate(np.concatenate(z))
-        Bx, By, Bz = self.field(x,y,z)
-        
-        title = r"$I = "+str(self.I)+"A, x_0 = "+str(self.x0)+", y_0 = "+str(self.y0)+", z_0 = "+str(self.z0)+", r_0 = $"+str(self.r0)+", N = "+str(self.N)+", L = "+str(self.L)
-        
-        fig = plt.figure(figsize=figsize)
-        ax = fig.gca(projection='3d')
-        ax.set_xlabel(r"x",fontsize=15)
-        ax.set_ylabel(r"y",fontsize=15)
-        ax.set_zlabel(r"z",fontsize=15)
-        ax.set_title(title,fontsize=15)
-        ax.quiver(x, y, z, Bx, By, Bz, length=self.r0*0.2, normalize=True, color = colorArrow)
-        
-        for loop in self.loops:
-            t = np.linspace(0,2*np.pi,100)
-            xs = loop.x0 + loop.r0*np.cos(t)
-            ys = loop.y0 + loop.r0*np.sin(t)
-            zs = loop.z0*np.ones(len(t))
-            ax.plot(xs,ys,zs,color=colorLoop,linewidth=linewidth)
-        
-        return fig
+        from Solenoyds import Plot
+        return Plot.displaySolenoidField3D(self,figsize,nb_points,colorLoop,colorArrow,linewidth,maxLoops,fig)
 
-    def displayField2D(self,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True):
+    def displayField2D(self,eq_0="y",figsize=(10,10),nb_points=20,color="blue",markLoop=True,maxLoops=500,fig=None):
         """
         To display the field in a plan x=0, y=0 or z=0
 
@@ -232,6 +549,10 @@ class Solenoid:
                 color of the arrows
             - markLoop: boolean
                 To diplay the position of the loops
+            - maxLoops: int
+                largest number of loops marked, None for all of them
+            - fig: matplotlib.figure.Figure
+                a figure to reuse, cleared first, None for a new one
         * Returns
             - fig: matplotlib.pyplot.figure
                 the figure
@@ -241,57 +562,12 @@ class Solenoid:
             fig = sol.displayField2D(figsize=(8,8))
             fig.savefig("sol_2D.png")
         """
-        nb_points = int(nb_points)
-        fig = plt.figure(figsize=figsize)
-        
-        title = r"$I = "+str(self.I)+"A, x_0 = "+str(self.x0)+", y_0 = "+str(self.y0)+", z_0 = "+str(self.z0)+", r_0 = $"+str(self.r0)+", N = "+str(self.N)+", L = "+str(self.L)
-        if eq_0 == "x":
-            xlabel = r"$y$"
-            ylabel = r"$z$"
-            title += r", $x = "+str(self.x0)+"$"
-            x1, x2 = np.meshgrid(np.linspace(-3*self.r0+self.y0, 3*self.r0+self.y0, nb_points),np.linspace(self.z0-self.L,self.z0+self.L, nb_points))
-            x3 = np.zeros_like(x1)+self.x0
-            Bx3, Bx1, Bx2 = self.field(x3, x1, x2)
-            
-        elif eq_0 == "y":
-            xlabel = r"$x$"
-            ylabel = r"$z$"
-            title += r", $y = "+str(self.y0)+"$"
-            x1, x2 = np.meshgrid(np.linspace(-3*self.r0+self.x0, 3*self.r0+self.x0, nb_points),np.linspace(self.z0-self.L,self.z0+self.L, nb_points))
-            x3 = np.zeros_like(x1)+self.y0
-            Bx1, Bx3, Bx2 = self.field(x1, x3, x2)
-        else:
-            print("Your choice of plan is incorrect")
-            return fig
-        
-        if markLoop:
-            for loop in self.loops:
-                if eq_0 == "x":
-                    dotx1 = np.array([-loop.r0,loop.r0])+loop.y0
-                    dotx2 = [loop.z0,loop.z0]
-                elif eq_0 == "y":
-                    
-                    dotx1 = np.array([-loop.r0,loop.r0])+loop.x0
-                    dotx2 = [loop.z0,loop.z0]
-                plt.plot(dotx1,dotx2,'.',ms=5,color="red")
-            
-        no = np.sqrt(Bx1**2+Bx2**2+Bx3**2)
-        Bx1 = Bx1/no
-        Bx2 = Bx2/no
-
-        plt.quiver(x1,x2,Bx1,Bx2,color=color)
-            
-                
-        plt.title(title,fontsize=15)
-        plt.xlabel(xlabel,fontsize=15)
-        plt.ylabel(ylabel,fontsize=15)
-        plt.tight_layout()
-
-        return fig
+        from Solenoyds import Plot
+        return Plot.displaySolenoidField2D(self,eq_0,figsize,nb_points,color,markLoop,maxLoops,fig)
     
-    def exportFieldMap(self,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points):
+    def exportFieldMap(self,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,workers=1,format=None,precision=None,slabSize=2**20,progress=None,dtype=np.float64):
         """
-        To export a field map as a .txt file
+        To export a field map as a .txt, .npy, .npz or .fmap file
         
         * Arguments
             - filename: String
@@ -310,26 +586,74 @@ class Solenoid:
                 the z max coordinate
             - nb_points: int
                 number of points of evaluation on each axis
+            - workers: int
+                number of threads used to compute the field
+            - format: String
+                "txt", "npy", "npz" or "raw", None to use the extension
+                of filename (see Solenoyds.Export)
+            - precision: int
+                number of significant digits in the text format,
+                None for the shortest representation giving back the same float
+            - slabSize: int
+                number of points computed and written at once, the memory
+                used only depends on it
+            - progress: function
+                progress(done,total) is called after each slab with the
+                number of points written and the total number of points
+            - dtype: np.dtype
+                np.float64, or np.float32 to write the map in single
+                precision (see Solenoyds.Loop.FLOAT32_ERROR)
         * Example
             sol = Solenoid(n=50)
             sol.exportFieldMap("output_map.txt",-1,1,-1,1,-1,1,20)
+            sol.exportFieldMap("output_map.fmap",-1,1,-1,1,-1,1,20)
         """
         
-        x, y, z = np.meshgrid(np.linspace(xmin,xmax,nb_points),
-                              np.linspace(ymin,ymax,nb_points),
-                              np.linspace(zmin,zmax,nb_points))
-        x = np.concatenate(np.concatenate(x))
-        y = np.concatenate(np.concatenate(y))
-        z = np.concatenate(np.concatenate(z))
-        Bx, By, Bz = self.field(x,y,z)
+        field = lambda x,y,z: self._field(x,y,z,workers=workers,dtype=dtype)
+        if self.cache is not None:
+            self.cache.exportFieldMap(self,field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format,precision,slabSize,progress,dtype)
+            return
+        writeFieldMap(field,filename,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,format,precision,slabSize,progress,dtype)
+
+    def fieldMapSlabs(self,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize=2**20,workers=1,dtype=np.float64):
+        """
+        To compute a field map slab by slab, in the order of exportFieldMap
         
-        with open(filename,'w') as f:
-            for i in np.arange(len(x)):
-                f.write(str(x[i])+';'+str(y[i])+';'+str(z[i])+';'+str(Bx[i])+';'+str(By[i])+';'+str(Bz[i])+'\n')
+        * Arguments
+            - xmin: float
+                the x min coordinate
+            - xmax: float
+                the x max coordinate
+            - ymin: float
+                the y min coordinate
+            - ymax: float
+                the y max coordinate
+            - zmin: float
+                the z min coordinate
+            - zmax: float
+                the z max coordinate
+            - nb_points: int
+                number of points of evaluation on each axis
+            - slabSize: int
+                number of points in each slab
+            - workers: int
+                number of threads used to compute the field
+            - dtype: np.dtype
+                the precision of the field
+        * Yields
+            - x, y, z, Bx, By, Bz: 1D np.array(float)
+                the coordinates and the magnetic field of the points of a slab
+        * Example
+            sol = Solenoid(n=50)
+            for x, y, z, Bx, By, Bz in sol.fieldMapSlabs(-1,1,-1,1,-1,1,100):
+                print(np.max(np.abs(Bz)))
+        """
+        field = lambda x,y,z: self.field(x,y,z,workers=workers,dtype=dtype)
+        return fieldMapSlabs(field,xmin,xmax,ymin,ymax,zmin,zmax,nb_points,slabSize)
 
-    def exportField(self,filename,x,y,z):
+    def exportField(self,filename,x,y,z,workers=1,format=None,precision=None,dtype=np.float64):
         """
-        To export the field computed in some points as a .txt file
+        To export the field computed in some points as a .txt, .npy, .npz or .fmap file
         
         * Arguments
             - filename: String
@@ -340,6 +664,17 @@ class Solenoid:
                 the y coordinates
             - z: 1D np.array(float)
                 the z coordinates
+            - workers: int
+                number of threads used to compute the field
+            - format: String
+                "txt", "npy", "npz" or "raw", None to use the extension
+                of filename (see Solenoyds.Export)
+            - precision: int
+                number of significant digits in the text format,
+                None for the shortest representation giving back the same float
+            - dtype: np.dtype
+                np.float64, or np.float32 to write the field in single
+                precision (see Solenoyds.Loop.FLOAT32_ERROR)
         * Example
             z = np.linspace(-2,2,20)
             x = np.zeros_like(z)
@@ -348,11 +683,8 @@ class Solenoid:
             sol.exportField("output.txt",x,y,z)
         """
         
-        Bx, By, Bz = self.field(x,y,z)
-        
-        with open(filename,'w') as f:
-            for i in np.arange(len(x)):
-                f.write(str(x[i])+';'+str(y[i])+';'+str(z[i])+';'+str(Bx[i])+';'+str(By[i])+';'+str(Bz[i])+'\n')
+        Bx, By, Bz = self.field(x,y,z,workers=workers,dtype=dtype)
+        writeField(filename,x,y,z,Bx,By,Bz,None,format,precision,dtype)
     
     def plotFieldMainAxis(self,zmin,zmax,nbpoints=100,figsize=(8,5)):
         """
@@ -377,27 +709,8 @@ class Solenoid:
             fig = sol.plotFieldMainAxis(zmin=-sol.L,zmax=sol.L)
             fig.savefig("axis_sol.png")
         """
-        
-        nbpoints = int(nbpoints)
-        z = np.linspace(zmin,zmax,nbpoints)+self.z0
-        x = np.zeros_like(z)+self.x0
-        y = np.zeros_like(z)+self.y0
-        
-        Bx, By, Bz = self.field(x,y,z)
-
-        fig = plt.figure(figsize=figsize)
-
-        plt.plot(z,Bz)
-        plt.xlabel(r"$z$ $(m)$",fontsize=15)
-        plt.ylabel(r"$B_z$ $(T)$",fontsize=15)
-        plt.title("Magnetic field on the main axis",fontsize=15)
-        plt.axis([min(z),max(z),min(Bz),max(Bz)*1.1])
-        plt.grid()
-
-        
-        plt.tight_layout()
-        
-        return fig
+        from Solenoyds import Plot
+        return Plot.plotFieldMainAxis(self,zmin,zmax,nbpoints,figsize)
     
     def colormapField(self, figsize=(6,5), nbpoints=200):
         """
@@ -420,53 +733,7 @@ class Solenoid:
             fig2.savefig("colomap2.png")
             fig3.savefig("colomap3.png")
         """
-        
-        d = np.linspace(-self.L,self.L,200)
-        x, z = np.meshgrid(d,d)
-        y = np.zeros_like(x)
-        x += self.x0
-        y += self.y0
-        y += self.y0
-
-        Bx, By, Bz = self.field(x,y,z)
-        B = np.sqrt(Bx**2+By**2+Bz**2)
-
-        m = np.max(np.abs(Bz))
-        x01 = - self.r0
-        z01 = - self.L/2
-        x02 = self.r0
-        z02 = self.L/2
-
-        fig1 = plt.figure(figsize=(6,5))
-        im = plt.imshow(Bx,cmap=plt.cm.seismic, extent=(-self.L,self.L,-self.L,self.L), origin='lower',vmin=-m,vmax=m)
-        plt.plot([x01,x01],[z01,z02],lw=2,color='black')
-        plt.plot([x02,x02],[z01,z02],lw=2,color='black')
-        plt.colorbar(im)
-        plt.title(r"$Br$",fontsize=15)
-        plt.xlabel(r"$r$",fontsize=15)
-        plt.ylabel(r"$z$",fontsize=15)
-        plt.tight_layout()
-
-
-        fig2 = plt.figure(figsize=(6,5))
-        im = plt.imshow(Bz,cmap=plt.cm.seismic, extent=(-self.L,self.L,-self.L,self.L), origin='lower',vmin=-m,vmax=m)
-        plt.plot([x01,x01],[z01,z02],color='black')
-        plt.plot([x02,x02],[z01,z02],color='black')
-        plt.colorbar(im)
-        plt.title(r"$B_z$",fontsize=15)
-        plt.xlabel(r"$r$",fontsize=15)
-        plt.ylabel(r"$z$",fontsize=15)
-        plt.tight_layout()
-
-        fig3 = plt.figure(figsize=(6,5))
-        im = plt.imshow(B,cmap=plt.cm.seismic, extent=(-self.L,self.L,-self.L,self.L), origin='lower',vmin=-m,vmax=m)
-        plt.plot([x01,x01],[z01,z02],color='black')
-        plt.plot([x02,x02],[z01,z02],color='black')
-        plt.colorbar(im)
-        plt.title(r"$|B|$",fontsize=15)
-        plt.xlabel(r"$r$",fontsize=15)
-        plt.ylabel(r"$z$",fontsize=15)
-        plt.tight_layout()
-        return fig1, fig2, fig3
+        from Solenoyds import Plot
+        return Plot.colormapField(self,figsize,nbpoints)
         
         
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+
+To count and time the evaluations of the field
+
+The instrumentation is off by default: the field kernels only check that
+_active is None. Inside an instrument() block, they record their work in the
+Stats object of the block.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+# the Stats object receiving the records, None when the instrumentation is off
+_active = None
+
+# below this value of 1-m, the elliptic integrals are close to their singularity
+NEAR_SINGULAR = 0.01
+
+class Stats:
+    """
+    To hold the counts and timings recorded in an instrument() block
+
+    * Attributes
+        - self.calls: int
+            number of calls of the field methods of Loop and Solenoid
+        - self.points: int
+            number of points requested from these methods
+        - self.loops: int
+            number of loops of the evaluated objects, summed over the calls
+            (1 for a loop or a current sheet)
+        - self.kernelCalls: int
+            number of calls of the field kernels
+        - self.pairs: int
+            number of (loop, point) pairs evaluated by the kernels
+        - self.onAxis: int
+            number of pairs on the axis (r = 0)
+        - self.nearSingular: int
+            number of pairs with 1-m < NEAR_SINGULAR, close to the wire
+        - self.onWire: int
+            number of pairs on the wire (or on the edges of a current sheet),
+            where the field is nan
+        - self.ellipticTime: float
+            time in seconds spent in the elliptic integrals
+        - self.kernelTime: float
+            time in seconds spent in the field kernels
+        - self.wallTime: float
+            duration in seconds of the instrument() block
+    """
+    def __init__(self):
+        self.calls = 0
+        self.points = 0
+        self.loops = 0
+        self.kernelCalls = 0
+        self.pairs = 0
+        self.onAxis = 0
+        self.nearSingular = 0
+        self.onWire = 0
+        self.ellipticTime = 0.
+        self.kernelTime = 0.
+        self.wallTime = 0.
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "\n".join("%-13s %s" % (k,v) for k, v in self.asDict().items())
+
+    def asDict(self):
+        """
+        To get the counts and the timings
+
+        * Returns
+            - stats: dict
+                the attributes, and "overheadTime", the time spent outside
+                of the elliptic integrals
+        """
+        names = ("calls","points","loops","kernelCalls","pairs","onAxis","nearSingular",
+                 "onWire","ellipticTime","kernelTime","wallTime")
+        stats = {name:getattr(self,name) for name in names}
+        stats["overheadTime"] = self.wallTime-self.ellipticTime
+        return stats
+
+    def _call(self,points,loops):
+        """
+        To record a call of a field method
+        """
+        with self._lock:
+            self.calls += 1
+            self.points += int(points)
+            self.loops += int(loops)
+
+    def _kernel(self,pairs,onAxis,nearSingular,onWire,ellipticTime,kernelTime):
+        """
+        To record a call of a field kernel
+        """
+        with self._lock:
+            self.kernelCalls += 1
+            self.pairs += int(pairs)
+            self.onAxis += int(onAxis)
+            self.nearSingular += int(nearSingular)
+            self.onWire += int(onWire)
+            self.ellipticTime += ellipticTime
+            self.kernelTime += kernelTime
+
+@contextmanager
+def instrument():
+    """
+    To record the evaluations of the field in a block
+
+    The blocks can be nested, the records go to the innermost one.
+
+    * Yields
+        - stats: Stats
+            the counts and timings, filled during the block
+
+    * Example
+        sol = Solenoid(n=100)
+        with instrument() as stats:
+            sol.exportFieldMap("output_map.fmap",-1,1,-1,1,-1,1,50)
+        print(stats)
+    """
+    global _active
+    stats = Stats()
+    previous = _active
+    _active = stats
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.wallTime = time.perf_counter()-start
+        _active = previous
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Solenoyds.Loop import _fieldRZ, _toCartesian, _BYTES_PER_PAIR
+from Solenoyds.Solenoid import Solenoid, _sheetFieldRZ
+
+_PARAMETERS = ("I","L","n","r0")
+_COMPONENTS = ("Bx","By","Bz")
+
+def _sweepFieldRZ(geometries,r,dz,model="loops",maxMemory=1e8):
+    """
+    To compute the field of several solenoids with a current of 1 A, all
+    centered on the origin
+
+    With the "loops" model, the turns of all the solenoids are evaluated
+    together against the points, by blocks bounded by maxMemory, and summed
+    solenoid by solenoid. With the "sheet" model, the closed form is
+    broadcast over the solenoids.
+
+    * Arguments
+        - geometries: 2D np.array(float)
+            L, n and r0 of each solenoid, shape (G,3)
+        - r: 1D np.array(float)
+            the distance from the axis
+        - dz: 1D np.array(float)
+            the coordinate along the axis, relative to the centers
+        - model: string
+            "loops" or "sheet"
+        - maxMemory: float
+            maximum memory in bytes used by the temporary arrays
+
+    * Returns
+        - Br, Bz: (2D np.array(float),2D np.array(float))
+            The radial and axial magnetic field, shape (G,len(r))
+    """
+    Br = np.zeros((len(geometries),len(r)))
+    Bz = np.zeros((len(geometries),len(r)))
+    pairs = max(1,int(maxMemory//_BYTES_PER_PAIR))
+    if model == "sheet":
+        step = max(1,pairs//max(1,len(r)))
+        for g in range(0,len(geometries),step):
+            L, n, r0 = geometries[g:g+step,:,np.newaxis].transpose(1,0,2)
+            Br[g:g+step], Bz[g:g+step] = _sheetFieldRZ(4E-7*np.pi*n,r0,L/2,r,dz)
+        return Br, Bz
+
+    frame, B0, r0, z0 = [], [], [], []
+    for g, (L, n, radius) in enumerate(geometries):
+        sol = Solenoid(I=1,L=L,n=n,r0=radius)
+        frame.append(np.full(sol.N,g))
+        B0.append(sol.strengths)
+        r0.append(sol.radii)
+        z0.append(sol.centers[:,2])
+    frame, B0, r0, z0 = (np.concatenate(v) for v in (frame,B0,r0,z0))
+
+    turnStep = max(1,min(len(frame),pairs))
+    pointStep = max(1,pairs//turnStep)
+    for i in range(0,len(r),pointStep):
+        block = slice(i,i+pointStep)
+        for j in range(0,len(frame),turnStep):
+            turns = slice(j,j+turnStep)
+            f = frame[turns]
+            br, bz = _fieldRZ(B0[turns,np.newaxis],r0[turns,np.newaxis],
+                              r[np.newaxis,block],dz[np.newaxis,block]-z0[turns,np.newaxis])
+            # the turns are sorted by solenoid, sum them solenoid by solenoid
+            starts = np.flatnonzero(np.r_[True,f[1:] != f[:-1]])
+            Br[f[starts],block] += np.add.reduceat(br,starts,axis=0)
+            Bz[f[starts],block] += np.add.reduceat(bz,starts,axis=0)
+    return Br, Bz
+
+class SweepResult:
+    """
+    To hold the field of a grid of solenoids in a set of points
+
+    * Attributes
+        - self.I, self.L, self.n, self.r0: 1D np.array(float)
+            the values of the parameters, the axes of the grid
+        - self.x, self.y, self.z: 1D np.array(float)
+            the coordinates of the points
+        - self.B: 6D np.array(float)
+            the field, shape (len(I),len(L),len(n),len(r0),3,len(x))
+        - self.dims: tuple(String)
+            the names of the axes of B,
+            ("I","L","n","r0","component","point")
+    """
+    dims = _PARAMETERS+("component","point")
+
+    def __init__(self,I,L,n,r0,x,y,z,B):
+        self.I = I
+        self.L = L
+        self.n = n
+        self.r0 = r0
+        self.x = x
+        self.y = y
+        self.z = z
+        self.B = B
+
+    def __str__(self):
+        return ", ".join(name+" = "+str(len(getattr(self,name))) for name in _PARAMETERS)+", points = "+str(len(self.x))
+
+    def _component(self,component):
+        """
+        To get one component of the field, or its norm for "B"
+        """
+        if component == "B":
+            return np.linalg.norm(self.B,axis=4)
+        if component not in _COMPONENTS:
+            raise ValueError("component must be \"Bx\", \"By\", \"Bz\" or \"B\"")
+        return self.B[...,_COMPONENTS.index(component),:]
+
+    def sel(self,**parameters):
+        """
+        To select the configurations with given values of the parameters
+
+        * Arguments
+            - parameters: float
+                the values of some of the parameters I, L, n and r0
+
+        * Returns
+            - B: np.array(float)
+                the field, without the axes of the selected parameters
+
+        * Example
+            result = sweep(0,0,np.linspace(-0.2,0.2,11),I=[100,200],L=[1,2])
+            B = result.sel(I=200,L=2) # shape (1,1,3,11)
+        """
+        index = []
+        for name in _PARAMETERS:
+            if name in parameters:
+                matches = np.flatnonzero(np.isclose(getattr(self,name),parameters.pop(name)))
+                if len(matches) == 0:
+                    raise ValueError("this value of "+name+" is not in the sweep")
+                index.append(matches[0])
+            else:
+                index.append(slice(None))
+        if parameters:
+            raise ValueError("unknown parameters: "+", ".join(parameters))
+        return self.B[tuple(index)]
+
+    def mean(self,component="Bz"):
+        """
+        To compute the mean of the field over the points
+
+        * Arguments
+            - component: String
+                "Bx", "By", "Bz" or "B" for the norm
+
+        * Returns
+            - mean: 4D np.array(float)
+                shape (len(I),len(L),len(n),len(r0))
+        """
+        return np.mean(self._component(component),axis=-1)
+
+    def uniformity(self,component="Bz"):
+        """
+        To compute the uniformity of the field over the points, such as a bore
+
+        * Arguments
+            - component: String
+                "Bx", "By", "Bz" or "B" for the norm
+
+        * Returns
+            - uniformity: 4D np.array(float)
+                (max-min)/|mean| of the component, shape
+                (len(I),len(L),len(n),len(r0))
+        """
+        B = self._component(component)
+        return (np.max(B,axis=-1)-np.min(B,axis=-1))/np.abs(np.mean(B,axis=-1))
+
+    def best(self,merit):
+        """
+        To find the configuration with the smallest figure of merit
+
+        * Arguments
+            - merit: 4D np.array(float)
+                a value for each configuration, such as self.uniformity(),
+                nan for the excluded configurations
+
+        * Returns
+            - parameters: dict
+                the values of I, L, n and r0
+
+        * Example
+            result = sweep(0,0,np.linspace(-0.2,0.2,11),L=[1,2,4],r0=[0.2,0.5])
+            print(result.best(result.uniformity()))
+        """
+        index = np.unravel_index(np.nanargmin(merit),np.shape(merit))
+        return {name:getattr(self,name)[i].item() for name, i in zip(_PARAMETERS,index)}
+
+def sweep(x,y,z,I=400,L=1,n=2000,r0=0.5,x0=0,y0=0,z0=0,model="loops",maxMemory=1e8,workers=1):
+    """
+    To compute the field of a grid of solenoids in a fixed set of points
+
+    The field is proportional to I, so it is computed once for each
+    geometry (L, n, r0) with 1 A and scaled for all the currents. All the
+    geometries are evaluated together, or spread over a pool of processes
+    with several workers.
+
+    * Arguments
+        - x, y, z: np.array(float)
+            the coordinates of the points
+        - I, L, n, r0: float or 1D np.array(float)
+            the values of the current intensity, the length, the number of
+            loops per meter and the radius, see Solenoid
+        - x0, y0, z0: float
+            the position of the center of the solenoids
+        - model: string
+            "loops" or "sheet", see Solenoid
+        - maxMemory: float
+            maximum memory in bytes used by the temporary arrays, in each
+            process
+        - workers: int
+            number of processes sharing the geometries
+
+    * Returns
+        - result: SweepResult
+            the field of every configuration, with the figures of merit
+
+    * Example
+        z = np.linspace(-0.2,0.2,21)
+        result = sweep(0*z,0*z,z,I=[100,200,400],L=[1,2],n=[500,1000],r0=[0.2,0.5])
+        uniformity = result.uniformity() # shape (3,2,2,2)
+        print(result.best(uniformity))
+    """
+    if model not in ("loops","sheet"):
+        raise ValueError("model must be \"loops\" or \"sheet\"")
+    values = [np.atleast_1d(np.asarray(v,dtype=float)) for v in (I,L,n,r0)]
+    if any(v.ndim != 1 for v in values):
+        raise ValueError("I, L, n and r0 must be numbers or 1D arrays")
+    x, y, z = (v.ravel() for v in np.broadcast_arrays(np.asarray(x,dtype=float),
+                                                      np.asarray(y,dtype=float),
+                                                      np.asarray(z,dtype=float)))
+    X = x-x0
+    Y = y-y0
+    r = np.sqrt(X**2+Y**2)
+    dz = z-z0
+
+    # the solenoids are symmetric about their center: the unique (r, |dz|)
+    # pairs are computed and scattered back, Br changing sign with dz
+    sign = np.where(dz < 0,-1.,1.)
+    pairs, inverse = np.unique(np.stack([r,np.abs(dz)],axis=1),axis=0,return_inverse=True)
+    inverse = inverse.ravel()
+
+    geometries = np.array(list(itertools.product(*values[1:])),dtype=float).reshape(-1,3)
+    workers = max(1,min(int(workers),len(geometries)))
+    if workers == 1:
+        Br, Bz = _sweepFieldRZ(geometries,pairs[:,0],pairs[:,1],model,maxMemory)
+    else:
+        chunks = np.array_split(geometries,workers)
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_sweepFieldRZ,chunks,*[[v]*workers for v in (pairs[:,0],pairs[:,1],model,maxMemory)]))
+        Br = np.concatenate([result[0] for result in results])
+        Bz = np.concatenate([result[1] for result in results])
+    Br = sign*Br[:,inverse]
+    Bz = Bz[:,inverse]
+
+    B = np.stack(_toCartesian(X,Y,r,Br,Bz),axis=1)
+    shape = tuple(len(v) for v in values[1:])+(3,len(x))
+    B = values[0][:,np.newaxis,np.newaxis,np.newaxis,np.newaxis,np.newaxis]*B.reshape(shape)
+    return SweepResult(*values,x,y,z,B)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+"""
+import numpy as np
+
+# speed of light in m/s
+SPEED_OF_LIGHT = 299792458.0
+
+# Dormand-Prince 5(4) coefficients
+_A = [[],
+      [1/5],
+      [3/40,9/40],
+      [44/45,-56/15,32/9],
+      [19372/6561,-25360/2187,64448/6561,-212/729],
+      [9017/3168,-355/33,46732/5247,49/176,-5103/18656],
+      [35/384,0,500/1113,125/192,-2187/6784,11/84]]
+_B5 = np.array([35/384,0,500/1113,125/192,-2187/6784,11/84,0])
+_B4 = np.array([5179/57600,0,7571/16695,393/640,-92097/339200,187/2100,1/40])
+
+class Tracker:
+    """
+    To track charged particles and to trace field lines in a magnetic field
+
+    All the particles (or lines) are advanced together, with one call of the
+    field for all of them at each step (or stage), and the trajectories are
+    recorded in preallocated arrays.
+
+    * Attributes
+        - self.source: Loop, Solenoid, FieldMap...
+            any object with a method field(x,y,z)
+    """
+    def __init__(self,source):
+        """
+        The constructor
+
+        * Arguments
+            - source: Loop, Solenoid, FieldMap...
+                any object with a method field(x,y,z)
+
+        * Example
+            tracker = Tracker(Solenoid(n=100))
+        """
+        self.source = source
+
+    def _field(self,points):
+        """
+        To compute the field in an array of points of shape (n,3)
+        """
+        return np.stack(self.source.field(points[:,0],points[:,1],points[:,2]),axis=1)
+
+    def trackParticles(self,position,velocity,charge,mass,dt,nb_steps,stop=None,relativistic=True):
+        """
+        To track charged particles with the Boris pusher
+
+        The field is purely magnetic, so the Lorentz factor of each particle
+        is constant and the pusher only rotates the velocities.
+
+        * Arguments
+            - position: 2D np.array(float)
+                the initial positions, shape (n,3)
+            - velocity: 2D np.array(float)
+                the initial velocities in m/s, shape (n,3)
+            - charge: float or 1D np.array(float)
+                the charges in C
+            - mass: float or 1D np.array(float)
+                the masses in kg
+            - dt: float
+                the time step in s
+            - nb_steps: int
+                the number of steps
+            - stop: function
+                stop(position,velocity) returns a boolean array, True for the
+                particles to stop (for example when they leave a field map)
+            - relativistic: boolean
+                to include the Lorentz factor
+
+        * Returns
+            - positions: 3D np.array(float)
+                the positions, shape (nb_steps+1,n,3), nan after a particle stops
+            - velocities: 3D np.array(float)
+                the velocities, shape (nb_steps+1,n,3), nan after a particle stops
+            - steps: 1D np.array(int)
+                the number of steps done by each particle, a particle also
+                stops when its field or its position is not finite (on a
+                wire, out of a field map...)
+
+        * Example
+            tracker = Tracker(Solenoid(n=100))
+            v = np.array([[1e6,0,1e6]])
+            positions, velocities, steps = tracker.trackParticles([[0.1,0,0]],v,-1.6e-19,9.1e-31,1e-12,1000)
+        """
+        x = np.array(position,dtype=float).reshape(-1,3)
+        v = np.array(velocity,dtype=float).reshape(-1,3)
+        n = len(x)
+        nb_steps = int(nb_steps)
+        qm = np.broadcast_to(np.asarray(charge,dtype=float)/np.asarray(mass,dtype=float),(n,))
+        if relativistic:
+            qm = qm*np.sqrt(1-np.sum(v**2,axis=1)/SPEED_OF_LIGHT**2)
+
+        positions = np.full((nb_steps+1,n,3),np.nan)
+        velocities = np.full((nb_steps+1,n,3),np.nan)
+        steps = np.zeros(n,dtype=int)
+        positions[0] = x
+        velocities[0] = v
+        active = np.ones(n,dtype=bool)
+        if stop is not None:
+            active &= ~np.asarray(stop(x,v),dtype=bool)
+
+        for i in range(nb_steps):
+            index = np.flatnonzero(active)
+            if len(index) == 0:
+                break
+            xi = x[index]
+            vi = v[index]
+            t = (qm[index]*dt/2)[:,np.newaxis]*self._field(xi)
+            s = 2*t/(1+np.sum(t**2,axis=1,keepdims=True))
+            vi = vi+np.cross(vi+np.cross(vi,t),s)
+            xi = xi+vi*dt
+            # a particle whose field is not finite stops before the step
+            bad = ~np.all(np.isfinite(xi)&np.isfinite(vi),axis=1)
+            active[index[bad]] = False
+            index, xi, vi = index[~bad], xi[~bad], vi[~bad]
+            x[index] = xi
+            v[index] = vi
+            positions[i+1,index] = xi
+            velocities[i+1,index] = vi
+            steps[index] += 1
+            if stop is not None:
+                active[index] = ~np.asarray(stop(xi,vi),dtype=bool)
+        return positions, velocities, steps
+
+    def traceFieldLines(self,start,length,nb_steps,method="rk4",tol=1e-8,stop=None):
+        """
+        To trace field lines, dx/ds = B/|B|
+
+        * Arguments
+            - start: 2D np.array(float)
+                the starting points, shape (n,3)
+            - length: float
+                the length of the lines, negative to follow -B
+            - nb_steps: int
+                the number of steps with "rk4", the largest number of steps
+                with "rk45", 0 to get the starting points
+            - method: string
+                "rk4" for fixed steps of length/nb_steps,
+                "rk45" for adaptive Dormand-Prince steps
+            - tol: float
+                the error accepted at each step with "rk45", in meter
+            - stop: function
+                stop(position) returns a boolean array, True for the lines to stop
+
+        * Returns
+            - positions: 3D np.array(float)
+                the points of the lines, shape (nb_steps+1,n,3), nan after the
+                end of a line
+            - steps: 1D np.array(int)
+                the number of steps done by each line, a line also stops
+                when its direction or its position is not finite (on a
+                wire, at a zero of the field, out of a field map...)
+
+        * Example
+            tracker = Tracker(Solenoid(n=100))
+            start = np.array([[0.1,0,0],[0.2,0,0]])
+            positions, steps = tracker.traceFieldLines(start,5,500)
+        """
+        if method not in ("rk4","rk45"):
+            raise ValueError("method must be \"rk4\" or \"rk45\"")
+        x = np.array(start,dtype=float).reshape(-1,3)
+        n = len(x)
+        nb_steps = int(nb_steps)
+        direction = np.sign(length) if length != 0 else 1.
+        length = abs(length)
+
+        def f(points):
+            B = self._field(points)
+            return direction*B/np.linalg.norm(B,axis=1,keepdims=True)
+
+        positions = np.full((nb_steps+1,n,3),np.nan)
+        positions[0] = x
+        steps = np.zeros(n,dtype=int)
+        done = np.zeros(n)
+        # with nb_steps = 0 the loop is not entered, as in trackParticles
+        h = np.full(n,length/max(nb_steps,1))
+        active = np.ones(n,dtype=bool)
+        if stop is not None:
+            active &= ~np.asarray(stop(x),dtype=bool)
+
+        for i in range(nb_steps if method == "rk4" else 100*nb_steps):
+            index = np.flatnonzero(active)
+            if len(index) == 0:
+                break
+            xi = x[index]
+            advance = np.minimum(h[index],length-done[index])
+            hi = advance[:,np.newaxis]
+            if method == "rk4":
+                k1 = f(xi)
+                k2 = f(xi+hi/2*k1)
+                k3 = f(xi+hi/2*k2)
+                k4 = f(xi+hi*k3)
+                xn = xi+hi/6*(k1+2*k2+2*k3+k4)
+                accepted = np.ones(len(index),dtype=bool)
+            else:
+                k = [f(xi)]
+                for a in _A[1:]:
+                    k.append(f(xi+hi*sum(aj*kj for aj, kj in zip(a,k))))
+                xn = xi+hi*sum(b*kj for b, kj in zip(_B5,k))
+                error = np.linalg.norm(hi*sum((b5-b4)*kj for b5, b4, kj in zip(_B5,_B4,k)),axis=1)
+                accepted = error <= tol
+                # usual step size control with a safety factor
+                factor = 0.9*(tol/np.maximum(error,1e-300))**0.2
+                h[index] = advance*np.clip(factor,0.2,5)
+
+            # a line whose field is not finite stops before the step, with
+            # "rk45" its error and its step size would be nan forever
+            bad = ~np.all(np.isfinite(xn),axis=1)
+            if method == "rk45":
+                bad |= ~np.isfinite(error)
+            active[index[bad]] = False
+            accepted &= ~bad
+            index = index[accepted]
+            xn = xn[accepted]
+            x[index] = xn
+            done[index] += advance[accepted]
+            steps[index] += 1
+            positions[steps[index],index] = xn
+            finished = (done[index] >= length*(1-1e-12)) | (steps[index] >= nb_steps)
+            if stop is not None:
+                finished |= np.asarray(stop(xn),dtype=bool)
+            active[index[finished]] = False
+        return positions, steps
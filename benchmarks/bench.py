@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: samuel.niang@cern.ch
+https://github.com/sniang/Solenoyds
+https://sniang.github.io/Solenoyds
+
+Benchmarks of the compute and export paths
+
+* Usage
+    python benchmarks/bench.py --output new.json
+    python benchmarks/bench.py --output new.json --compare old.json --threshold 1.25
+    python benchmarks/bench.py --quick --filter Solenoid.field
+    python benchmarks/bench.py --accuracy --filter none
+    python benchmarks/bench.py --imports --filter none
+
+Each case is run several times and the best time is kept. With --compare,
+the cases slower than threshold times the reference are reported and the
+script exits with status 1. With --accuracy, the single precision field is
+compared to the double precision one, the analytic gradient to central
+differences and the "sheet" model to the sum of the loops, and the script
+exits with status 1 if the documented bound FLOAT32_ERROR (or
+GRADIENT_ERROR, SHEET_ERROR) is exceeded. With --imports, the modules
+without plotting are imported in a new interpreter, and the script exits with
+status 1 if they load matplotlib or if Loop and Solenoid take more than
+IMPORT_BUDGET.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import scipy
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# largest error of field_and_gradient against central differences, relative
+# to the largest derivative (the differences themselves are good to ~1e-9)
+GRADIENT_ERROR = 1e-6
+
+# largest difference between the "sheet" and the "loops" models away from the
+# winding, relative to the largest field and multiplied by the number of
+# loops N: the sum of the loops converges to the current sheet as 1/N (about
+# 1.3/N for Solenoid(L=1))
+SHEET_ERROR = 2.0
+
+# largest time in seconds to import Loop and Solenoid in a new interpreter,
+# numpy included (about 0.1 s alone), without matplotlib
+IMPORT_BUDGET = 0.5
+
+# largest relative difference between Solenoid.field and the sum of the
+# fields of its loops, with edited strengths and radii (rounding only)
+LOOPS_ERROR = 1e-10
+
+# largest |R@R.T-1| and |R@(0,0,1)-axis| of the rotations of CoilSystem, for
+# axes close to -z too
+ROTATION_ERROR = 1e-12
+
+# the modules which must not import matplotlib, the plotting is in Plot.py
+CORE_MODULES = ("Loop","Solenoid","Export","Stats","Cache","FieldMap","AdaptiveMap",
+                "Multipole","Paraxial","CoilSystem","Tracker","Sweep","Server","Render")
+
+def timeit(func,repeat=5,budget=2.0):
+    """
+    To time a function
+
+    * Arguments
+        - func: function
+            the function to time, without arguments
+        - repeat: int
+            the largest number of runs
+        - budget: float
+            the runs stop after this time in seconds, after at least one run
+
+    * Returns
+        - best: float
+            the best time in seconds
+        - runs: int
+            the number of runs
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat and (not times or time.perf_counter()-start < budget):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-t)
+    return min(times), len(times)
+
+def cases(quick=False,filter=""):
+    """
+    To generate the benchmark cases
+
+    The setup of a group of cases (an adaptive map, a server and its
+    clients, matplotlib) is only done when the generator reaches it and one
+    of its cases matches the filter, and everything is closed when the
+    generator ends.
+
+    * Arguments
+        - quick: boolean
+            to use smaller sizes
+        - filter: string
+            only the cases whose name contains this string are needed
+
+    * Returns
+        - cases: generator((string,function))
+            the name and the function of each case
+    """
+    from Solenoyds.Loop import Loop
+    from Solenoyds.Solenoid import Solenoid
+
+    def wanted(*names):
+        return any(filter in name for name in names)
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory, contextlib.ExitStack() as cleanup:
+        loop = Loop(1,0.1,0.2,0.3,0.5)
+        for P in ([10**4] if quick else [10**4,10**5,10**6]):
+            x, y, z = rng.uniform(-1,1,(3,P))
+            yield "Loop.field P="+str(P), lambda x=x,y=y,z=z: loop.field(x,y,z)
+
+        for N in ([100] if quick else [100,1000,10000]):
+            sol = Solenoid(n=N,L=1)
+            for P in ([10**3] if quick else [10**3,10**4]):
+                x, y, z = rng.uniform(-1,1,(3,P))
+                yield "Solenoid.field N="+str(N)+" P="+str(P), lambda s=sol,x=x,y=y,z=z: s.field(x,y,z)
+            l = np.linspace(-1,1,20)
+            x, y, z = np.meshgrid(l,l,l)
+            yield "Solenoid.field N="+str(N)+" grid=20^3", lambda s=sol,x=x,y=y,z=z: s.field(x,y,z)
+            yield ("Solenoid.field N="+str(N)+" grid=20^3 float32",
+                   lambda s=sol,x=x,y=y,z=z: s.field(x,y,z,dtype=np.float32))
+            yield ("Solenoid.field_and_gradient N="+str(N)+" grid=20^3",
+                   lambda s=sol,x=x,y=y,z=z: s.field_and_gradient(x,y,z))
+
+        for n, L in ([(2000,1)] if quick else [(2000,1),(2000,10),(2000,50)]):
+            yield "Solenoid.__init__ n="+str(n)+" L="+str(L), lambda n=n,L=L: Solenoid(n=n,L=L)
+
+        sol = Solenoid(n=100)
+        for nb in ([10] if quick else [10,20,40]):
+            for ext in ("txt","fmap"):
+                filename = os.path.join(directory,"map."+ext)
+                yield ("Solenoid.exportFieldMap nb_points="+str(nb)+" "+ext,
+                       lambda nb=nb,f=filename: sol.exportFieldMap(f,-1,1,-1,1,-1,1,nb))
+        for nb in ([10] if quick else [10,40]):
+            filename = os.path.join(directory,"map32.fmap")
+            yield ("Solenoid.exportFieldMap nb_points="+str(nb)+" fmap float32",
+                   lambda nb=nb,f=filename: sol.exportFieldMap(f,-1,1,-1,1,-1,1,nb,dtype=np.float32))
+        for P in ([10**3] if quick else [10**3,10**5]):
+            x, y, z = rng.uniform(-1,1,(3,P))
+            filename = os.path.join(directory,"points.txt")
+            yield "Solenoid.exportField P="+str(P)+" txt", lambda f=filename,x=x,y=y,z=z: sol.exportField(f,x,y,z)
+
+        from Solenoyds.AdaptiveMap import AdaptiveMap
+        for model in ("sheet","loops"):
+            source = Solenoid(n=100,model=model)
+            yield "AdaptiveMap "+model+" tol=1e-5", lambda s=source: AdaptiveMap(s,-1,1,-1,1,-1,1,tol=1e-5)
+        names = ["AdaptiveMap.field P="+str(P) for P in ([10**4] if quick else [10**4,10**6])]
+        if wanted(*names):
+            amap = AdaptiveMap(Solenoid(n=100,model="sheet"),-1,1,-1,1,-1,1,tol=1e-5)
+            for name in names:
+                x, y, z = rng.uniform(-1,1,(3,int(name.split("=")[-1])))
+                yield name, lambda x=x,y=y,z=z: amap.field(x,y,z)
+
+        from Solenoyds.Sweep import sweep
+        x, y, z = rng.uniform(-0.2,0.2,(3,1000))
+        grid = {"I":[100,200,400],"L":[0.5,1,2],"n":[100,300],"r0":[0.2,0.5]}
+        for model in ("loops","sheet"):
+            yield ("sweep 36 configurations P=1000 "+model,
+                   lambda model=model,x=x,y=y,z=z: sweep(x,y,z,model=model,**grid))
+
+        names = ["FieldClient.field P=100","FieldClient.field 16 clients P=100"]
+        if wanted(*names):
+            import asyncio
+            import threading
+            from concurrent.futures import ThreadPoolExecutor
+            from Solenoyds.Server import FieldServer, FieldClient
+            server = FieldServer(Solenoid(n=100),path=os.path.join(directory,"field.sock"))
+            eventLoop = asyncio.new_event_loop()
+            cleanup.callback(eventLoop.close)
+            eventLoop.run_until_complete(server.start())
+            thread = threading.Thread(target=eventLoop.run_forever,daemon=True)
+            thread.start()
+            cleanup.callback(thread.join)
+            cleanup.callback(eventLoop.call_soon_threadsafe,eventLoop.stop)
+            cleanup.callback(lambda: asyncio.run_coroutine_threadsafe(server.close(),eventLoop).result())
+            clients = [cleanup.enter_context(FieldClient(server.path)) for i in range(16)]
+            pool = cleanup.enter_context(ThreadPoolExecutor(len(clients)))
+            x, y, z = rng.uniform(-1,1,(3,100))
+            yield names[0], lambda: clients[0].field(x,y,z)
+            yield names[1], lambda: list(pool.map(lambda c: c.field(x,y,z),clients))
+
+        names = (["Solenoid.colormapField N="+str(N) for N in ([50] if quick else [50,500])]+
+                 ["Solenoid.displaySolenoid N="+str(N) for N in ([100] if quick else [100,1000,10000])])
+        if not wanted(*names):
+            return
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+        except ImportError:
+            print("matplotlib is not available, the plotting cases are skipped")
+            return
+        def colormap(s):
+            figures = s.colormapField()
+            plt.close("all")
+            return figures
+        for N in ([50] if quick else [50,500]):
+            yield "Solenoid.colormapField N="+str(N), lambda s=Solenoid(n=N,x0=2,L=5): colormap(s)
+        import io
+        from matplotlib.figure import Figure
+        figure = Figure()
+        def display(s):
+            s.displaySolenoid(fig=figure).savefig(io.BytesIO(),format="png")
+        for N in ([100] if quick else [100,1000,10000]):
+            yield "Solenoid.displaySolenoid N="+str(N), lambda s=Solenoid(n=N,L=1): display(s)
+
+def accuracy(quick=False):
+    """
+    To check the error of the single precision field against FLOAT32_ERROR,
+    the error of the gradient against GRADIENT_ERROR and the difference
+    between the "sheet" and the "loops" models against SHEET_ERROR, and
+    the solenoids with edited turns against the sum of their loops, and the
+    orthogonality of the rotations of CoilSystem
+
+    The error is the largest |B32-B64|/|B64| over random points around the
+    source, without the points where the field is not finite or zero.
+
+    * Arguments
+        - quick: boolean
+            to use fewer points
+
+    * Returns
+        - failures: list(string)
+            the names of the sources whose error exceeds the bound
+    """
+    import warnings
+    from Solenoyds.Loop import Loop, FLOAT32_ERROR
+    from Solenoyds.Solenoid import Solenoid
+
+    rng = np.random.default_rng(0)
+    P = 1000 if quick else 5000
+    sources = [("Loop",Loop(1,0.1,0.2,0.3,0.5)),
+               ("Solenoid N=100",Solenoid(n=100)),
+               ("Solenoid N=2000",Solenoid(n=2000,L=1)),
+               ("Solenoid N=5000 off center",Solenoid(n=1000,L=5,x0=3,z0=20)),
+               ("Solenoid sheet",Solenoid(n=100,model="sheet"))]
+    if not quick:
+        sources.append(("Solenoid N=20000",Solenoid(n=2000,L=10)))
+    failures = []
+    print("\n%-50s %12s %12s" % ("float32 accuracy","error","bound"))
+    for name, source in sources:
+        size = max(2,getattr(source,"L",2))*3
+        x, y, z = rng.uniform(-size,size,(3,P))
+        x += source.x0
+        y += source.y0
+        z += source.z0
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            B64 = np.linalg.norm(source.field(x,y,z),axis=0)
+            error = np.linalg.norm(np.subtract(source.field(x,y,z,dtype=np.float32),source.field(x,y,z)),axis=0)
+        ok = np.isfinite(error) & (B64 > 0)
+        error = np.max(error[ok]/B64[ok])
+        flag = ""
+        if error > FLOAT32_ERROR:
+            failures.append(name)
+            flag = "  FAILED"
+        print("%-50s %12.3e %12.3e%s" % (name,error,FLOAT32_ERROR,flag))
+
+    # the gradient against central differences, relative to the largest
+    # derivative, and its trace (div B) which must vanish
+    print("\n%-50s %12s %12s" % ("gradient accuracy","error","bound"))
+    h = 1e-6
+    for name, source in sources[:3]+sources[4:5]:
+        x, y, z = rng.uniform(-1,1,(3,P//10))
+        x += source.x0
+        y += source.y0
+        z += source.z0
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            Bx, By, Bz, G = source.field_and_gradient(x,y,z)
+            difference = np.empty(G.shape)
+            for j in range(3):
+                d = h*np.eye(3)[j]
+                plus = source.field(x+d[0],y+d[1],z+d[2])
+                minus = source.field(x-d[0],y-d[1],z-d[2])
+                difference[...,j] = np.stack(np.subtract(plus,minus),axis=-1)/(2*h)
+        ok = np.all(np.isfinite(difference),axis=(1,2))
+        scale = np.max(np.abs(G[ok]))
+        error = max(np.max(np.abs(G[ok]-difference[ok])),np.max(np.abs(np.trace(G[ok],axis1=1,axis2=2))))/scale
+        flag = ""
+        if error > GRADIENT_ERROR:
+            failures.append(name+" gradient")
+            flag = "  FAILED"
+        print("%-50s %12.3e %12.3e%s" % (name,error,GRADIENT_ERROR,flag))
+
+    # the closed form of the current sheet against the discrete sum of the
+    # loops, out of a band of 0.05 m around the winding
+    print("\n%-50s %12s %12s" % ("sheet against loops, error*N","error","bound"))
+    x, y, z = rng.uniform(-2,2,(3,P//2))
+    keep = (np.abs(np.sqrt(x**2+y**2)-0.5) > 0.05) | (np.abs(z) > 0.55)
+    x, y, z = x[keep], y[keep], z[keep]
+    for n in ([100,1000] if quick else [100,1000,10000]):
+        sheet = np.array(Solenoid(n=n,L=1,model="sheet").field(x,y,z))
+        loops = np.array(Solenoid(n=n,L=1).field(x,y,z))
+        error = n*np.max(np.linalg.norm(sheet-loops,axis=0))/np.max(np.linalg.norm(sheet,axis=0))
+        flag = ""
+        if error > SHEET_ERROR:
+            failures.append("Solenoid sheet N="+str(n))
+            flag = "  FAILED"
+        print("%-50s %12.3e %12.3e%s" % ("Solenoid sheet N="+str(n),error,SHEET_ERROR,flag))
+
+    # the solenoids with edited turns against the sum of their loops, the
+    # mirror symmetry must not be used for asymmetric strengths or radii
+    print("\n%-50s %12s %12s" % ("edited turns against loops","error","bound"))
+    x, y, z = rng.uniform(-1,1,(3,P//10))
+    tapered = Solenoid(n=20,L=1)
+    tapered.strengths *= np.linspace(0.5,1.5,tapered.N)
+    flared = Solenoid(n=20,L=1)
+    flared.radii *= np.linspace(0.8,1.2,flared.N)
+    symmetric = Solenoid(n=20,L=1)
+    symmetric.strengths *= 1+np.abs(np.linspace(-1,1,symmetric.N))
+    for name, source in (("Solenoid tapered strengths",tapered),("Solenoid flared radii",flared),
+                         ("Solenoid symmetric strengths",symmetric)):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            B = np.array(source.field(x,y,z))
+            loops = sum(np.array(loop.field(x,y,z)) for loop in source.loops)
+        error = np.max(np.linalg.norm(B-loops,axis=0))/np.max(np.linalg.norm(loops,axis=0))
+        flag = ""
+        if not error <= LOOPS_ERROR:
+            failures.append(name)
+            flag = "  FAILED"
+        print("%-50s %12.3e %12.3e%s" % (name,error,LOOPS_ERROR,flag))
+
+    # the rotations of CoilSystem must stay orthonormal for the axes close to
+    # -z, where the Rodrigues formula divides by 1+cos
+    from Solenoyds.CoilSystem import _rotation
+    print("\n%-50s %12s %12s" % ("CoilSystem rotations","error","bound"))
+    for name, axes in (("axes near -z",[(e,f,-1) for e in (0,1e-12,1e-7,1e-3) for f in (0,-1e-9,1e-5)]),
+                       ("random axes",list(rng.normal(size=(P//10,3))))):
+        error = 0
+        for axis in axes:
+            R = _rotation(axis)
+            error = max(error,np.max(np.abs(R@R.T-np.eye(3))),
+                        np.max(np.abs(R[:,2]-np.asarray(axis)/np.linalg.norm(axis))))
+        flag = ""
+        if not error <= ROTATION_ERROR:
+            failures.append("CoilSystem rotation "+name)
+            flag = "  FAILED"
+        print("%-50s %12.3e %12.3e%s" % (name,error,ROTATION_ERROR,flag))
+    return failures
+
+def imports(repeat=3):
+    """
+    To check that the core modules are imported without matplotlib, and
+    within IMPORT_BUDGET for Loop and Solenoid
+
+    Each import is done in a new interpreter, several times, and the best
+    time is kept. Each interpreter also exits with status 1 if matplotlib is
+    in sys.modules or if its import takes more than IMPORT_BUDGET, and a
+    module which cannot be imported is a failure.
+
+    * Arguments
+        - repeat: int
+            number of interpreters
+
+    * Returns
+        - failures: list(string)
+            the names of the failed checks
+    """
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              "import Solenoyds.Loop, Solenoyds.Solenoid\n"
+              "duration = time.perf_counter()-start\n"
+              +"".join("import Solenoyds."+name+"\n" for name in CORE_MODULES)+
+              "print(duration)\n"
+              "plotting = ','.join(m for m in sys.modules if m.split('.')[0] in ('matplotlib','mpl_toolkits'))\n"
+              "print(plotting)\n"
+              "sys.exit(1 if plotting or duration > "+repr(IMPORT_BUDGET)+" else 0)\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ,PYTHONPATH=root+os.pathsep+os.environ.get("PYTHONPATH",""))
+    times = []
+    failures = []
+    print("\n%-50s %12s %12s" % ("imports","time","bound"))
+    for i in range(repeat):
+        process = subprocess.run([sys.executable,"-c",script],capture_output=True,text=True,env=env,cwd=root)
+        output = process.stdout.split("\n")
+        if len(output) < 3:
+            failures.append("import error")
+            print("%-50s %12s  %s" % ("import "+", ".join(CORE_MODULES[:4])+"...","FAILED",process.stderr.strip().split("\n")[-1][:60]))
+            return failures
+        times.append(float(output[0]))
+        plotting = output[1]
+    flag = ""
+    if min(times) > IMPORT_BUDGET:
+        failures.append("import time")
+        flag = "  FAILED"
+    print("%-50s %12.3f %12.3f%s" % ("import Loop, Solenoid",min(times),IMPORT_BUDGET,flag))
+    if plotting:
+        failures.append("matplotlib imported")
+        print("%-50s %12s  %s" % ("import "+", ".join(CORE_MODULES),"FAILED",plotting[:60]))
+    else:
+        print("%-50s %12s" % ("import "+", ".join(CORE_MODULES[:4])+"...","no matplotlib"))
+    return failures
+
+def compare(results,reference,threshold):
+    """
+    To compare two runs
+
+    * Arguments
+        - results: dict
+            the times of the new run
+        - reference: dict
+            the times of the reference run
+        - threshold: float
+            the largest accepted ratio new/reference
+
+    * Returns
+        - regressions: list(string)
+            the names of the slower cases
+    """
+    regressions = []
+    print("\n%-50s %12s %12s %8s" % ("case","reference","new","ratio"))
+    for name, new in results.items():
+        if name not in reference:
+            continue
+        old = reference[name]["time"]
+        ratio = new["time"]/old
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-50s %12.6f %12.6f %8.2f%s" % (name,old,new["time"],ratio,flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of Solenoyds")
+    parser.add_argument("--output",help="JSON file where the results are written")
+    parser.add_argument("--compare",help="JSON file of a reference run")
+    parser.add_argument("--threshold",type=float,default=1.25,help="largest accepted ratio new/reference")
+    parser.add_argument("--quick",action="store_true",help="smaller sizes")
+    parser.add_argument("--filter",default="",help="only run the cases whose name contains this string")
+    parser.add_argument("--repeat",type=int,default=5,help="largest number of runs of each case")
+    parser.add_argument("--accuracy",action="store_true",help="check the error of the single precision field and of the gradient")
+    parser.add_argument("--imports",action="store_true",help="check the import time of the core and that it does not load matplotlib")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with contextlib.closing(cases(args.quick,args.filter)) as generator:
+        for name, func in generator:
+            if args.filter not in name:
+                continue
+            best, runs = timeit(func,args.repeat)
+            results[name] = {"time":best,"runs":runs}
+            print("%-50s %12.6f s" % (name,best))
+
+    meta = {"date":time.strftime("%Y-%m-%d %H:%M:%S"),"python":platform.python_version(),
+            "numpy":np.__version__,"scipy":scipy.__version__,"machine":platform.machine(),
+            "processor":platform.processor(),"cpus":os.cpu_count(),"quick":args.quick}
+    if args.output:
+        with open(args.output,"w") as f:
+            json.dump({"meta":meta,"results":results},f,indent=1)
+
+    status = 0
+    if args.accuracy and accuracy(args.quick):
+        status = 1
+    if args.imports and imports():
+        status = 1
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)["results"]
+        regressions = compare(results,reference,args.threshold)
+        if regressions:
+            print("\n"+str(len(regressions))+" regression(s)")
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())